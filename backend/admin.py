@@ -7,7 +7,8 @@ from .models import (
     AdvancementNote, 
     Notification, 
     AdvancementNoteImage,
-    PreventiveTaskTemplate # New import
+    PreventiveTaskTemplate, # New import
+    HourMeterReading
 )
 
 @admin.register(UserProfile)
@@ -37,9 +38,19 @@ class OrdreImputationAdmin(admin.ModelAdmin):
     readonly_fields = (
         'date_derniere_visite_effectuee', 
         'total_hours_of_work', # Make it read-only as it's calculated
-        'last_notified_threshold' # Make it read-only as it's system-set
+        'last_notified_threshold', # Make it read-only as it's system-set
+        'next_preventive_threshold',
+        'next_preventive_warning_hours',
+        'cycle_visite_reminder_sent_for'
     ) 
 
+@admin.register(HourMeterReading)
+class HourMeterReadingAdmin(admin.ModelAdmin):
+    list_display = ('ordre_imputation', 'reading', 'recorded_at')
+    search_fields = ('ordre_imputation__value',)
+    date_hierarchy = 'recorded_at'
+    autocomplete_fields = ['ordre_imputation']
+
 @admin.register(PreventiveTaskTemplate)
 class PreventiveTaskTemplateAdmin(admin.ModelAdmin):
     list_display = ('title', 'ordre_imputation', 'trigger_hours', 'description_preview')
@@ -84,7 +95,7 @@ class TaskAdmin(admin.ModelAdmin):
 class AdvancementNoteImageInline(admin.TabularInline):
     model = AdvancementNoteImage
     extra = 1 
-    readonly_fields = ('uploaded_at',)
+    readonly_fields = ('medium', 'thumbnail', 'processing_status', 'uploaded_at',)
 
 @admin.register(AdvancementNote)
 class AdvancementNoteAdmin(admin.ModelAdmin):
@@ -0,0 +1,79 @@
+from rest_framework import filters
+from rest_framework import exceptions as drf_exceptions
+import datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Task
+
+
+class TaskFilterBackend(filters.BaseFilterBackend):
+    """
+    Server-side filters for the task list.
+
+    Multi-valued parameters accept a comma separated list:
+      status, type, ordre_value, assigned_to (profile id), technician (id_technician)
+    Date ranges (YYYY-MM-DD, inclusive):
+      start_date_after/start_date_before, end_date_after/end_date_before,
+      closed_after/closed_before
+    """
+    multi_value_filters = {
+        'status': 'status__in',
+        'type': 'type__in',
+        'ordre_value': 'ordre_id__in',
+        'assigned_to': 'assigned_to_profile_id__in',
+    }
+    date_range_filters = {
+        'start_date_after': 'start_date__gte',
+        'start_date_before': 'start_date__lte',
+        'end_date_after': 'end_date__gte',
+        'end_date_before': 'end_date__lte',
+        'closed_after': 'closed_at__gte',
+        'closed_before': 'closed_at__lt',
+    }
+    # closed_at is a datetime: compare against day boundaries so its index stays usable.
+    datetime_lookups = {'closed_at__gte': 0, 'closed_at__lt': 1}
+
+    @staticmethod
+    def split_values(raw_value):
+        return [value.strip() for value in raw_value.split(',') if value.strip()]
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filter_kwargs = {}
+
+        for param, lookup in self.multi_value_filters.items():
+            if params.get(param):
+                filter_kwargs[lookup] = self.split_values(params[param])
+
+        for param, lookup in self.date_range_filters.items():
+            if params.get(param):
+                try:
+                    parsed = parse_date(params[param])
+                except ValueError:
+                    parsed = None
+                if parsed is None:
+                    raise drf_exceptions.ValidationError({param: "Invalid date format. Please use YYYY-MM-DD."})
+                if lookup in self.datetime_lookups:
+                    day = parsed + datetime.timedelta(days=self.datetime_lookups[lookup])
+                    parsed = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+                filter_kwargs[lookup] = parsed
+
+        if 'status__in' in filter_kwargs:
+            valid_statuses = {choice[0] for choice in Task.STATUS_CHOICES}
+            invalid = set(filter_kwargs['status__in']) - valid_statuses
+            if invalid:
+                raise drf_exceptions.ValidationError({"status": f"Invalid status: {', '.join(sorted(invalid))}."})
+
+        if filter_kwargs:
+            try:
+                queryset = queryset.filter(**filter_kwargs)
+            except (ValueError, TypeError):
+                raise drf_exceptions.ValidationError({"error": "Invalid filter value."})
+
+        if params.get('technician'):
+            # Subquery on the M2M table avoids the duplicate rows (and DISTINCT) of a join.
+            technician_ids = self.split_values(params['technician'])
+            queryset = queryset.filter(
+                pk__in=Task.techniciens.through.objects.filter(technician_id__in=technician_ids).values('task_id')
+            )
+        return queryset
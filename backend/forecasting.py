@@ -0,0 +1,191 @@
+import datetime
+
+import numpy as np
+from django.utils import timezone
+
+from .models import HourMeterReading, OrdreImputation
+from .preventive import get_preventive_schedules
+
+DEFAULT_LOOKBACK_DAYS = 90
+MAX_FORECAST_DAYS = 3650
+# Readings closer together than this (e.g. task saves and OI patches in one sitting) say nothing about daily usage.
+MIN_FIT_SPAN_DAYS = 1.0
+
+
+def estimate_usage_rates(index, now, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """
+    Least-squares usage rate (hours per day) of every OI in `index`
+    ({oi id: position}) over its readings of the last `lookback_days`.
+
+    All OIs are fitted together: readings are grouped by position and the
+    per-OI sums come from np.bincount, so there is no Python loop per OI.
+    Returns (rates, reading counts); the rate is NaN with fewer than two
+    readings or when they span less than MIN_FIT_SPAN_DAYS.
+    """
+    size = len(index)
+    since = now - datetime.timedelta(days=lookback_days)
+    rows = [
+        (index[oi_id], recorded_at.timestamp(), float(reading))
+        for oi_id, recorded_at, reading in HourMeterReading.objects.filter(recorded_at__gte=since)
+                                                                   .values_list('ordre_imputation_id', 'recorded_at', 'reading')
+        if oi_id in index
+    ]
+    if not rows:
+        return np.full(size, np.nan), np.zeros(size, dtype=int)
+
+    data = np.array(rows)
+    groups = data[:, 0].astype(int)
+    days = (data[:, 1] - now.timestamp()) / 86400.0
+    hours = data[:, 2]
+
+    counts = np.bincount(groups, minlength=size)
+    first_day = np.full(size, np.inf)
+    last_day = np.full(size, -np.inf)
+    np.minimum.at(first_day, groups, days)
+    np.maximum.at(last_day, groups, days)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_days = np.bincount(groups, weights=days, minlength=size) / counts
+        mean_hours = np.bincount(groups, weights=hours, minlength=size) / counts
+        centered_days = days - mean_days[groups]
+        covariance = np.bincount(groups, weights=centered_days * (hours - mean_hours[groups]), minlength=size)
+        variance = np.bincount(groups, weights=centered_days ** 2, minlength=size)
+        rates = np.where((variance > 0) & (last_day - first_day >= MIN_FIT_SPAN_DAYS), covariance / variance, np.nan)
+    return rates, counts
+
+
+def schedule_positions(index, current_hours):
+    """
+    Per OI, on its schedule's repeating cycle: the next threshold above the
+    current hours, the last one at or below them (0 before the first), and
+    the checklist size of the next one. Unscheduled OIs get NaN / 0.
+    """
+    size = len(index)
+    entries = [
+        (index[oi_id], thresh, schedule.cycle_length, len(schedule.checklist(thresh)))
+        for oi_id, schedule in get_preventive_schedules(index).items()
+        for thresh in schedule.thresholds
+        if thresh > 0 and schedule.template_hours(thresh) in schedule.checklists
+    ]
+    targets = np.full(size, np.inf)
+    previous = np.zeros(size)
+    checklist_sizes = np.zeros(size, dtype=int)
+    if entries:
+        positions, thresholds, cycle_lengths, sizes = np.array(entries, dtype=float).T
+        positions = positions.astype(int)
+        elapsed_cycles = np.floor((current_hours[positions] - thresholds) / cycle_lengths)
+        candidates = thresholds + np.maximum(0, elapsed_cycles + 1) * cycle_lengths
+        np.minimum.at(targets, positions, candidates)
+        # Points at or below the current hours (elapsed_cycles >= 0) bound the interval from below.
+        np.maximum.at(previous, positions, np.where(elapsed_cycles >= 0, thresholds + elapsed_cycles * cycle_lengths, 0))
+        winners = candidates == targets[positions]
+        checklist_sizes[positions[winners]] = sizes[winners].astype(int)
+    targets[np.isinf(targets)] = np.nan
+    return targets, previous, checklist_sizes
+
+
+def compute_preventive_forecast(ordres, now=None, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """
+    Column-wise forecast for `ordres`, one numpy array per metric, all OIs in
+    one vectorized pass.
+    """
+    now = now or timezone.now()
+    index = {oi.pk: position for position, oi in enumerate(ordres)}
+    current_hours = np.array([float(oi.total_hours_of_work) for oi in ordres], dtype=float)
+    last_notified = np.array([oi.last_notified_threshold or 0 for oi in ordres], dtype=float)
+
+    rates, counts = estimate_usage_rates(index, now, lookback_days)
+    targets, previous, checklist_sizes = schedule_positions(index, current_hours)
+    remaining = targets - current_hours
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent_consumed = 100.0 * (current_hours - previous) / (targets - previous)
+        days_left = np.where(rates > 0, remaining / rates, np.nan)
+    reachable = np.isfinite(days_left) & (days_left <= MAX_FORECAST_DAYS)
+    days_left = np.where(reachable, np.ceil(np.round(days_left, 6)), np.nan)
+    forecast_dates = np.datetime64(timezone.localdate(now)) + \
+        np.where(reachable, days_left, 0).astype('timedelta64[D]')
+
+    return {
+        'total_hours_of_work': current_hours,
+        'last_notified_threshold': last_notified,
+        'previous_threshold': previous,
+        'next_threshold': targets,
+        'hours_remaining': remaining,
+        'percent_consumed': percent_consumed,
+        'checklist_size': checklist_sizes,
+        'warning_sent': np.isfinite(targets) & (last_notified >= targets),
+        'usage_rate_per_day': rates,
+        'readings_used': counts,
+        'days_until_due': days_left,
+        'forecast_date': np.where(reachable, forecast_dates, np.datetime64('NaT')),
+    }
+
+
+REPORT_ORDERING_FIELDS = (
+    'value', 'total_hours_of_work', 'next_threshold', 'hours_remaining', 'percent_consumed',
+    'checklist_size', 'usage_rate_per_day', 'days_until_due',
+)
+
+
+def forecast_rows(ordres, columns, positions):
+    def optional(value, digits=2):
+        return None if np.isnan(value) else round(float(value), digits)
+
+    return [
+        {
+            'id_ordre': ordres[position].id_ordre,
+            'value': ordres[position].value,
+            'total_hours_of_work': round(float(columns['total_hours_of_work'][position]), 2),
+            'last_notified_threshold': ordres[position].last_notified_threshold,
+            'previous_threshold': int(columns['previous_threshold'][position]),
+            'next_threshold': None if np.isnan(columns['next_threshold'][position]) else int(columns['next_threshold'][position]),
+            'hours_remaining': optional(columns['hours_remaining'][position]),
+            'percent_consumed': optional(columns['percent_consumed'][position], 1),
+            'checklist_size': int(columns['checklist_size'][position]),
+            'warning_sent': bool(columns['warning_sent'][position]),
+            'usage_rate_per_day': optional(columns['usage_rate_per_day'][position]),
+            'readings_used': int(columns['readings_used'][position]),
+            'days_until_due': None if np.isnan(columns['days_until_due'][position]) else int(columns['days_until_due'][position]),
+            'forecast_date': columns['forecast_date'][position].item(),
+        }
+        for position in positions
+    ]
+
+
+def forecast_preventive_thresholds(ordres=None, now=None, lookback_days=DEFAULT_LOOKBACK_DAYS,
+                                   max_hours_remaining=None, min_percent_consumed=None,
+                                   due_within_days=None, scheduled_only=False, ordering='hours_remaining'):
+    """
+    Fleet-wide preventive workload: for every OI, the hours remaining to its
+    next threshold, the share of the current interval already consumed, the
+    size of the checklist due there, and the projected date it is reached.
+
+    Filters and ordering are applied as array masks and an argsort over the
+    computed columns; OIs without a value for the ordering field sort last.
+    """
+    ordres = list(ordres if ordres is not None else OrdreImputation.objects.order_by('value'))
+    columns = compute_preventive_forecast(ordres, now, lookback_days)
+
+    keep = np.ones(len(ordres), dtype=bool)
+    if scheduled_only:
+        keep &= np.isfinite(columns['next_threshold'])
+    if max_hours_remaining is not None:
+        keep &= columns['hours_remaining'] <= max_hours_remaining
+    if min_percent_consumed is not None:
+        keep &= columns['percent_consumed'] >= min_percent_consumed
+    if due_within_days is not None:
+        keep &= columns['days_until_due'] <= due_within_days
+    positions = np.flatnonzero(keep)
+
+    descending = ordering.startswith('-')
+    field = ordering.lstrip('-')
+    if field == 'value':
+        keys = np.array([ordres[position].value for position in positions], dtype=object)
+        order = np.argsort(keys, kind='stable')
+        positions = positions[order[::-1] if descending else order]
+    else:
+        keys = columns[field][positions].astype(float)
+        missing = np.isnan(keys)
+        order = np.lexsort((-keys if descending else keys, missing))
+        positions = positions[order]
+
+    return forecast_rows(ordres, columns, positions)
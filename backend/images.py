@@ -0,0 +1,194 @@
+import datetime
+import io
+import posixpath
+import traceback
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import AdvancementNoteImage
+from .storage import content_addressed_storage, file_sha256
+from .workers import submit_to_pool
+
+
+def get_image_pipeline_execution():
+    """'pool' (local process pool, the default), 'worker' (process_note_images command) or 'inline'."""
+    return getattr(settings, 'IMAGE_PIPELINE_EXECUTION', 'pool')
+
+
+def get_max_image_size():
+    """Bounding box the stored image is capped to, in pixels."""
+    return tuple(getattr(settings, 'ADVANCEMENT_IMAGE_MAX_SIZE', (2048, 2048)))
+
+
+def get_rendition_sizes():
+    """
+    Bounding box of each named rendition, keyed by the AdvancementNoteImage
+    field that stores it. The thumbnail is enough for the app's lists and
+    300 dpi in the PDF; medium is what task detail views show.
+    """
+    return {
+        'medium': tuple(getattr(settings, 'ADVANCEMENT_IMAGE_MEDIUM_SIZE', (1024, 1024))),
+        'thumbnail': tuple(getattr(settings, 'ADVANCEMENT_IMAGE_THUMBNAIL_SIZE', (320, 320))),
+    }
+
+
+def get_jpeg_quality():
+    return getattr(settings, 'ADVANCEMENT_IMAGE_JPEG_QUALITY', 80)
+
+
+def load_upright_rgb(source, size):
+    """
+    Decodes `source` (a path or binary file) once, at the smallest JPEG draft
+    scale still above `size`, applies the EXIF orientation and flattens
+    transparency on white. The result carries no metadata.
+    """
+    with Image.open(source) as img:
+        img.draft('RGB', size)
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, 'white')
+            background.paste(img, mask=img.getchannel('A'))
+            return background
+        return img.convert('RGB')
+
+
+def encode_jpeg(img, quality=None):
+    output = io.BytesIO()
+    img.save(output, 'JPEG', quality=quality or get_jpeg_quality(), optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def render_thumbnail(source, size=None, quality=None):
+    """JPEG bytes of a single rendition of `source` fitting in `size`."""
+    img = load_upright_rgb(source, size or get_rendition_sizes()['thumbnail'])
+    img.thumbnail(size or get_rendition_sizes()['thumbnail'], Image.LANCZOS)
+    return encode_jpeg(img, quality)
+
+
+def render_image_set(source):
+    """
+    {field name: JPEG bytes} for the capped image and every rendition, from
+    one decode. Renditions are resized from the capped image, largest first.
+    """
+    img = load_upright_rgb(source, get_max_image_size())
+    img.thumbnail(get_max_image_size(), Image.LANCZOS)
+    encoded = {'image': encode_jpeg(img)}
+    for field, size in sorted(get_rendition_sizes().items(), key=lambda item: item[1], reverse=True):
+        img = img.copy()
+        img.thumbnail(size, Image.LANCZOS)
+        encoded[field] = encode_jpeg(img)
+    return encoded
+
+
+def claim_image(image_id):
+    """Moves a pending image to 'processing'; False if another worker has it or it is already done."""
+    return bool(AdvancementNoteImage.objects.filter(pk=image_id, processing_status='pending').update(processing_status='processing'))
+
+
+def process_note_image(image_id):
+    """
+    Runs the pipeline on one uploaded image: the upload is replaced by its
+    capped JPEG plus renditions, all content-addressed. If an image with the
+    same uploaded bytes was already processed, its files are reused without
+    decoding anything. Fields are saved with a queryset update so the upload
+    hook does not fire again; files no longer used are left to
+    collect_unreferenced_images(), since other rows may share them.
+    Returns the final processing status, or None if the image was not claimed.
+    """
+    if not claim_image(image_id):
+        return None
+    note_image = AdvancementNoteImage.objects.get(pk=image_id)
+    try:
+        with note_image.image.open('rb') as upload:
+            if not note_image.content_hash:
+                # Uploaded before content hashes were recorded.
+                note_image.content_hash = file_sha256(upload)
+                AdvancementNoteImage.objects.filter(pk=image_id).update(content_hash=note_image.content_hash)
+            twin = AdvancementNoteImage.objects.filter(
+                content_hash=note_image.content_hash, processing_status='ready'
+            ).exclude(pk=image_id).values('image', *get_rendition_sizes()).first()
+            if twin:
+                AdvancementNoteImage.objects.filter(pk=image_id).update(processing_status='ready', **twin)
+                return 'ready'
+            encoded = render_image_set(upload)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        # Kept as uploaded so nothing is lost; the PDF and the app fall back to the original.
+        traceback.print_exc()
+        AdvancementNoteImage.objects.filter(pk=image_id).update(processing_status='failed')
+        return 'failed'
+
+    names = {}
+    for field, data in encoded.items():
+        field_file = getattr(note_image, field)
+        names[field] = field_file.storage.save(field_file.field.generate_filename(note_image, f"{field}.jpg"), ContentFile(data))
+    AdvancementNoteImage.objects.filter(pk=image_id).update(processing_status='ready', **names)
+    return 'ready'
+
+
+def process_note_images(image_ids):
+    return [process_note_image(image_id) for image_id in image_ids]
+
+
+def enqueue_image_processing(image_ids):
+    execution = get_image_pipeline_execution()
+    if execution == 'inline':
+        process_note_images(image_ids)
+    elif execution == 'pool':
+        submit_to_pool('images', getattr(settings, 'IMAGE_PIPELINE_POOL_SIZE', 2), process_note_images, list(image_ids))
+    # 'worker': the images stay pending until process_note_images claims them.
+
+
+def referenced_image_names():
+    names = set()
+    for row in AdvancementNoteImage.objects.values_list('image', *get_rendition_sizes()).iterator():
+        names.update(name for name in row if name)
+    return names
+
+
+def is_image_referenced(name):
+    lookup = Q(image=name)
+    for field in get_rendition_sizes():
+        lookup |= Q(**{field: name})
+    return AdvancementNoteImage.objects.filter(lookup).exists()
+
+
+def stored_image_names(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for subdirectory in directories:
+        yield from stored_image_names(storage, posixpath.join(directory, subdirectory))
+
+
+def collect_unreferenced_images(grace=datetime.timedelta(hours=24), dry_run=False):
+    """
+    Deletes files under advancement_images/ that no AdvancementNoteImage
+    references any more: renditions replaced by reprocessing, uploads of
+    deleted notes, legacy originals. Files younger than `grace` are kept, as
+    an upload is stored before its row commits (a deduplicated upload
+    refreshes the existing file's mtime).
+    Returns (files deleted, bytes freed), or what would be with `dry_run`.
+    """
+    storage = content_addressed_storage
+    directory = AdvancementNoteImage._meta.get_field('image').upload_to.strip('/')
+    if not storage.exists(directory):
+        return 0, 0
+    referenced = referenced_image_names()
+    cutoff = timezone.now() - grace
+    deleted = freed = 0
+    for name in stored_image_names(storage, directory):
+        if name in referenced or storage.get_modified_time(name) > cutoff:
+            continue
+        # `referenced` may be minutes old by now: a row committed since then still counts.
+        if is_image_referenced(name):
+            continue
+        freed += storage.size(name)
+        deleted += 1
+        if not dry_run:
+            storage.delete(name)
+    return deleted, freed
@@ -0,0 +1,116 @@
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from backend.models import Task, Technician, OrdreImputation, UserProfile, AdvancementNote
+from backend.serializers import TaskListSerializer, TaskListRowSerializer
+from backend.views import get_task_list_queryset
+
+
+class RollbackSeed(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the task list fast path (TaskListRowSerializer) with TaskListSerializer: "
+        "checks that both produce the same JSON and reports the timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5, help="Timed runs per implementation.")
+        parser.add_argument('--expand', default='ordre,technicien_names', help="Value of the ?expand= parameter.")
+        parser.add_argument('--fields', default='', help="Value of the ?fields= parameter.")
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Create this many synthetic tasks first, inside a transaction that is rolled back afterwards."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+                self.run(options)
+                if options['seed']:
+                    raise RollbackSeed()
+        except RollbackSeed:
+            self.stdout.write("Synthetic tasks rolled back.")
+
+    def seed(self, count):
+        ordre, _ = OrdreImputation.objects.get_or_create(id_ordre='BENCH-OI', defaults={'value': 'BENCH-OI'})
+        chef = UserProfile.objects.filter(role='Chef de Parc').first()
+        technicians = [
+            Technician.objects.get_or_create(id_technician=f'BENCH-T{i}', defaults={'name': f'Bench Tech {i}'})[0]
+            for i in range(3)
+        ]
+        tasks = Task.objects.bulk_create([
+            Task(
+                ordre=ordre, tasks=f"Benchmark task {i}", type='curatif', status='in progress',
+                assigned_to_profile=chef, estimated_hours=Decimal('2.50'), hours_of_work=Decimal('1234.00'),
+                task_id_display=f'BENCH-{i}'
+            )
+            for i in range(count)
+        ])
+        Task.techniciens.through.objects.bulk_create([
+            Task.techniciens.through(task_id=task.pk, technician_id=tech.pk)
+            for task in tasks for tech in technicians
+        ])
+        AdvancementNote.objects.bulk_create([AdvancementNote(task=task, note="Benchmark note") for task in tasks])
+        self.stdout.write(f"Seeded {count} tasks.")
+
+    def run(self, options):
+        params = {}
+        if options['expand']:
+            params['expand'] = options['expand']
+        if options['fields']:
+            params['fields'] = options['fields']
+        request = Request(RequestFactory().get('/tasks/', params))
+
+        if not TaskListRowSerializer.supports(request):
+            raise CommandError("The fast path does not support expanding advancement_notes.")
+
+        def serializer_path():
+            queryset = get_task_list_queryset(request).order_by('-created_at', 'id')
+            return TaskListSerializer(queryset, many=True, context={'request': request}).data
+
+        def fast_path():
+            queryset = get_task_list_queryset(request).order_by('-created_at', 'id')
+            row_serializer = TaskListRowSerializer(request)
+            return row_serializer.to_representation(row_serializer.get_values_queryset(queryset))
+
+        expected = self.normalize(serializer_path())
+        actual = self.normalize(fast_path())
+        if expected != actual:
+            raise CommandError("Fast path output differs from TaskListSerializer output.")
+        self.stdout.write(f"Outputs match for {len(json.loads(actual))} tasks.")
+
+        serializer_time = self.best_of(serializer_path, options['iterations'])
+        fast_time = self.best_of(fast_path, options['iterations'])
+        self.stdout.write(f"TaskListSerializer:    {serializer_time * 1000:.1f} ms")
+        self.stdout.write(f"TaskListRowSerializer: {fast_time * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {serializer_time / fast_time:.1f}x"))
+
+    @staticmethod
+    def normalize(data):
+        # Technician order is unspecified in both paths (no ordering on the M2M relation).
+        rows = json.loads(json.dumps(data, cls=JSONEncoder))
+        for row in rows:
+            if 'technicien_names' in row:
+                row['technicien_names'] = sorted(row['technicien_names'])
+        return json.dumps(rows, sort_keys=False)
+
+    @staticmethod
+    def best_of(func, iterations):
+        timings = []
+        for _ in range(max(iterations, 1)):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
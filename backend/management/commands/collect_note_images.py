@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from backend.images import collect_unreferenced_images
+from backend.uploads import purge_expired_upload_sessions
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes advancement note image files that no AdvancementNoteImage references any more, "
+        "and resumable upload sessions left untouched for UPLOAD_SESSION_EXPIRY_HOURS. "
+        "Image files are content-addressed and shared between rows, so nothing else deletes them; run this from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help="Keep files younger than this, so uploads whose row is not committed yet survive."
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        if not options['dry_run']:
+            expired = purge_expired_upload_sessions()
+            self.stdout.write(f"{expired} expired upload session(s) deleted.")
+        deleted, freed = collect_unreferenced_images(timedelta(hours=options['grace_hours']), options['dry_run'])
+        verb = "would be deleted" if options['dry_run'] else "deleted"
+        self.stdout.write(f"{deleted} unreferenced file(s) {verb}, {freed / (1024 * 1024):.1f} MB.")
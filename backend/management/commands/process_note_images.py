@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from backend.images import process_note_image
+from backend.models import AdvancementNoteImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the image pipeline (capped JPEG, medium and thumbnail renditions) on pending advancement note images: "
+        "uploads from before the pipeline existed, or all uploads with IMAGE_PIPELINE_EXECUTION = 'worker'. "
+        "Safe to re-run: images already processed are skipped unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Reprocess every image, e.g. after changing the size settings.")
+        parser.add_argument(
+            '--requeue-stuck', action='store_true',
+            help="Also retry images left 'processing' or 'failed' by a crashed or interrupted worker."
+        )
+        parser.add_argument('--batch-size', type=int, default=200, help="Images fetched per query.")
+
+    def handle(self, *args, **options):
+        images = AdvancementNoteImage.objects.exclude(image='')
+        if options['force']:
+            images.update(processing_status='pending')
+        elif options['requeue_stuck']:
+            images.filter(processing_status__in=['processing', 'failed']).update(processing_status='pending')
+
+        counts = {'ready': 0, 'failed': 0}
+        pending = images.filter(processing_status='pending').order_by('pk').values_list('pk', flat=True)
+        for image_id in pending.iterator(chunk_size=options['batch_size']):
+            result = process_note_image(image_id)
+            if result:
+                counts[result] += 1
+            if result == 'failed':
+                self.stderr.write(f"Could not read image {image_id}.")
+        self.stdout.write(f"{counts['ready']} image(s) processed, {counts['failed']} image(s) skipped.")
@@ -0,0 +1,51 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.notifications import process_outbox_batch, get_outbox_backlog, purge_delivered_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Delivers queued notifications from the NotificationOutbox table. "
+        "Required when NOTIFICATION_DELIVERY = 'outbox'; with the default 'inline' delivery nothing is queued. "
+        "Runs continuously by default; use --once for cron-style runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Outbox entries claimed per transaction.")
+        parser.add_argument('--max-attempts', type=int, default=8, help="Attempts before an entry is parked as failed.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the outbox is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain what is due, then exit.")
+        parser.add_argument('--stats', action='store_true', help="Print the backlog metric as JSON and exit.")
+        parser.add_argument(
+            '--purge-after-days', type=int, default=7,
+            help="Delete delivered entries older than this many days (0 disables)."
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(get_outbox_backlog()))
+            return
+
+        try:
+            while True:
+                delivered, failed = process_outbox_batch(options['batch_size'], options['max_attempts'])
+                if delivered or failed:
+                    backlog = get_outbox_backlog()
+                    self.stdout.write(
+                        f"Delivered {delivered}, failed {failed}. "
+                        f"Backlog: {backlog['pending']} pending (oldest {backlog['oldest_pending_age_seconds']:.0f}s), "
+                        f"{backlog['failed']} parked."
+                    )
+                if delivered + failed < options['batch_size']:
+                    if options['purge_after_days']:
+                        purge_delivered_outbox(timezone.now() - timedelta(days=options['purge_after_days']))
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping notification outbox worker.")
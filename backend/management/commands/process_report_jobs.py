@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.report_jobs import fail_exhausted_report_jobs, purge_report_jobs, run_report_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders queued admin task reports (ReportJob rows). Needed with REPORT_JOB_EXECUTION = 'worker'; "
+        "with the default local pool it also picks up jobs left behind by a restarted server. "
+        "Runs continuously by default; use --once for cron-style runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when no job is queued.")
+        parser.add_argument('--once', action='store_true', help="Render what is queued, then exit.")
+        parser.add_argument(
+            '--purge-after-days', type=int, default=7,
+            help="Delete finished jobs and their files older than this many days (0 disables)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                fail_exhausted_report_jobs()
+                job = run_report_job()
+                if job is not None:
+                    self.stdout.write(f"Report job {job.pk} ({job.output_format}): {job.status}.")
+                    continue
+                if options['purge_after_days']:
+                    purge_report_jobs(timezone.now() - timedelta(days=options['purge_after_days']))
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping report job worker.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from backend.models import OrdreImputation, bump_collection_version, refresh_next_preventive_trigger
+from backend.preventive import get_preventive_schedules
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the precomputed next preventive threshold and warning point "
+        "of every Ordre d'Imputation (backfill after deploy or bulk imports)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per bulk UPDATE.")
+
+    def handle(self, *args, **options):
+        ordres = list(OrdreImputation.objects.only('pk', 'last_notified_threshold'))
+        schedules = get_preventive_schedules([oi.pk for oi in ordres])
+        for oi in ordres:
+            refresh_next_preventive_trigger(oi, schedules[oi.pk], save=False)
+        OrdreImputation.objects.bulk_update(
+            ordres, ['next_preventive_threshold', 'next_preventive_warning_hours'], batch_size=options['batch_size']
+        )
+        bump_collection_version('ordres_imputation')
+        scheduled = sum(1 for oi in ordres if oi.next_preventive_threshold is not None)
+        self.stdout.write(f"Refreshed {len(ordres)} OIs ({scheduled} with a preventive schedule).")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from backend.reminders import get_cycle_visit_reminder_days, send_cycle_visit_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Reminds Chefs de Parc and Admins of cycle visits due within the window. "
+        "Incremental: each visit date is reminded once, so it is safe to run from cron as often as needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Reminder window in days (default: CYCLE_VISIT_REMINDER_DAYS setting, 7)."
+        )
+        parser.add_argument('--include-overdue', action='store_true', help="Also remind visits whose date has passed.")
+        parser.add_argument('--batch-size', type=int, default=500, help="OIs notified per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the OIs that would be reminded.")
+
+    def handle(self, *args, **options):
+        window_days = options['days'] if options['days'] is not None else get_cycle_visit_reminder_days()
+        count = send_cycle_visit_reminders(
+            window_days=window_days,
+            include_overdue=options['include_overdue'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        verb = "would be reminded" if options['dry_run'] else "reminded"
+        self.stdout.write(f"{count} cycle visit(s) due within {window_days} day(s) {verb}.")
@@ -1,9 +1,15 @@
-from django.db import models
+from django.db import models, transaction, connection
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from django.db.models import Sum
+from django.db.models import Sum, F, Q, Count, Max
+from decimal import Decimal
+import hashlib
+import threading
+import uuid
+from .storage import content_addressed_storage, file_sha256
 
 class UserProfile(models.Model):
     ROLE_CHOICES = [
@@ -39,10 +45,61 @@ class OrdreImputation(models.Model):
         null=True, blank=True, 
         verbose_name="Last Notified Preventive Threshold (Actual Hours)" # Stores the 100% value for which 90% warning was sent
     )
+    # Precomputed by refresh_next_preventive_trigger(): the next threshold to warn
+    # for and its 90% warning point, so an hours update is a single comparison.
+    next_preventive_threshold = models.PositiveIntegerField(
+        null=True, blank=True,
+        verbose_name="Next Preventive Threshold (Actual Hours)"
+    )
+    next_preventive_warning_hours = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, db_index=True,
+        verbose_name="Next Preventive Warning Point (Hours)"
+    )
+    # Visit date the last cycle-visit reminder was sent for (see send_cycle_visit_reminders);
+    # a new date_prochain_cycle_visite makes the OI due for a reminder again.
+    cycle_visite_reminder_sent_for = models.DateField(null=True, blank=True, verbose_name="Rappel Envoyé pour la Visite du")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Fleet-wide "about to cross a threshold" lookups range-scan the hours left.
+            models.Index(
+                F('next_preventive_warning_hours') - F('total_hours_of_work'),
+                name='oi_hours_to_warning_idx'
+            ),
+            # Cycle-visit reminder sweep: range scan on the upcoming visit dates.
+            models.Index(fields=['date_prochain_cycle_visite'], name='oi_next_cycle_visit_idx'),
+        ]
 
     def __str__(self):
         return self.value
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a save only records an hour-meter reading when the hours changed.
+        instance._loaded_total_hours = instance.total_hours_of_work if 'total_hours_of_work' in field_names else None
+        return instance
+
+
+class HourMeterReading(models.Model):
+    """
+    Append-only history of an OI's hour meter, recorded whenever its
+    total_hours_of_work changes. Feeds the usage-rate forecasts.
+    """
+    ordre_imputation = models.ForeignKey(OrdreImputation, on_delete=models.CASCADE, related_name='hour_meter_readings')
+    reading = models.DecimalField(max_digits=10, decimal_places=2)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.ordre_imputation_id} @ {self.recorded_at:%Y-%m-%d %H:%M}: {self.reading}h"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ordre_imputation', 'recorded_at'], name='hour_reading_oi_time_idx'),
+            models.Index(fields=['recorded_at'], name='hour_reading_time_idx'),
+        ]
+
 class PreventiveTaskTemplate(models.Model):
     title = models.CharField(max_length=255, verbose_name="Titre de la Tâche Préventive")
     description = models.TextField(verbose_name="Description (élément de checklist)")
@@ -60,6 +117,13 @@ class PreventiveTaskTemplate(models.Model):
     def __str__(self):
         return f"{self.title} pour {self.ordre_imputation.value} @ {self.trigger_hours}h"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so moving a template to another OI also invalidates the old OI's schedule.
+        instance._loaded_ordre_imputation_id = instance.ordre_imputation_id if 'ordre_imputation_id' in field_names else None
+        return instance
+
     class Meta:
         verbose_name = "Modèle de Tâche Préventive"
         verbose_name_plural = "Modèles de Tâches Préventives"
@@ -123,16 +187,76 @@ class Task(models.Model):
     def __str__(self):
         return f"Task {self.task_id_display or self.id} - {self.ordre.value if self.ordre else 'N/A'}"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination on the task list (see TaskCursorPagination)
+            models.Index(fields=['-created_at', 'id'], name='task_created_id_idx'),
+            models.Index(fields=['assigned_to_profile', '-created_at'], name='task_assignee_created_idx'),
+            # Incremental sync (see SyncView)
+            models.Index(fields=['assigned_to_profile', 'updated_at'], name='task_assignee_updated_idx'),
+            models.Index(fields=['updated_at'], name='task_updated_idx'),
+            # Server-side list filters (see TaskFilterBackend)
+            models.Index(fields=['assigned_to_profile', 'status', '-created_at'], name='task_assignee_status_idx'),
+            models.Index(fields=['status', '-created_at'], name='task_status_created_idx'),
+            models.Index(fields=['ordre', '-created_at'], name='task_ordre_created_idx'),
+            models.Index(fields=['type', '-created_at'], name='task_type_created_idx'),
+            models.Index(fields=['start_date'], name='task_start_date_idx'),
+            models.Index(fields=['end_date'], name='task_end_date_idx'),
+            models.Index(fields=['closed_at'], name='task_closed_at_idx'),
+        ]
+
     @property
     def assignedTo(self):
         return self.assigned_to_profile.name if self.assigned_to_profile else None
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so saves that leave the hours alone skip the OI propagation.
+        instance._loaded_hours_of_work = instance.hours_of_work if 'hours_of_work' in field_names else None
+        instance._loaded_ordre_id = instance.ordre_id if 'ordre_id' in field_names else None
+        # Remembered so a reassignment can tell the previous Chef de Parc's sync to drop the task.
+        if 'assigned_to_profile_id' in field_names:
+            instance._loaded_assigned_to_profile_id = instance.assigned_to_profile_id
+        return instance
+
 def generate_task_id_display(instance):
     if instance.pk and not instance.task_id_display:
         instance.task_id_display = f"ORDT-{instance.pk}"
         Task.objects.filter(pk=instance.pk).update(task_id_display=instance.task_id_display)
 
 
+def allocate_task_ids(count):
+    """
+    Reserves `count` Task primary keys up front, so bulk inserts can write
+    the matching task_id_display in the INSERT itself. Call it inside the
+    transaction that inserts the rows.
+
+    Only PostgreSQL (sequence) and SQLite (serialized writers) can reserve ids
+    safely; elsewhere this returns None and callers insert row by row.
+    """
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return None
+    if count <= 0:
+        return []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [Task._meta.db_table, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    # SQLite hands out ids after the highest one used so far; it serializes
+    # writers, so no other insert can take them before this transaction commits.
+    last_id = Task.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    with connection.cursor() as cursor:
+        # AUTOINCREMENT never reuses the ids of deleted rows; neither should we.
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [Task._meta.db_table])
+        row = cursor.fetchone()
+        last_id = max(last_id, row[0] if row else 0)
+    return list(range(last_id + 1, last_id + 1 + count))
+
+
 class AdvancementNote(models.Model):
     task = models.ForeignKey(Task, related_name='advancement_notes', on_delete=models.CASCADE)
     date = models.DateField(default=timezone.now)
@@ -140,6 +264,7 @@ class AdvancementNote(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     created_by_username = models.CharField(max_length=150, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         task_identifier = self.task.task_id_display if self.task and self.task.task_id_display else self.task.id
@@ -151,13 +276,71 @@ class AdvancementNote(models.Model):
         super().save(*args, **kwargs)
 
 class AdvancementNoteImage(models.Model):
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     advancement_note = models.ForeignKey(AdvancementNote, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='advancement_images/')
+    # All files are content-addressed (see backend/storage.py): identical bytes are stored once and shared.
+    # Once processed (see backend/images.py): upright, metadata-free JPEG capped at ADVANCEMENT_IMAGE_MAX_SIZE.
+    image = models.ImageField(upload_to='advancement_images/', storage=content_addressed_storage)
+    # JPEG renditions: `medium` for task detail views, `thumbnail` for the PDF report and the app's lists.
+    medium = models.ImageField(upload_to='advancement_images/', storage=content_addressed_storage, blank=True, editable=False)
+    thumbnail = models.ImageField(upload_to='advancement_images/', storage=content_addressed_storage, blank=True, editable=False)
+    # SHA-256 of the bytes as uploaded, before processing: a re-upload reuses the renditions of its twin.
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    processing_status = models.CharField(max_length=10, choices=PROCESSING_STATUS_CHOICES, default='pending', db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Image for Note {self.advancement_note.id} - {self.image.name}"
 
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            self.content_hash = file_sha256(self.image.file)
+            # Reused by the storage instead of hashing the upload a second time.
+            self.image.file.sha256 = self.content_hash
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so replacing the original also reprocesses it.
+        instance._loaded_image_name = instance.image.name if 'image' in field_names else None
+        return instance
+
+class ImageUploadSession(models.Model):
+    """
+    A resumable upload of one note image (see backend/uploads.py). Chunks are
+    written to a part file outside MEDIA_ROOT; once complete, the upload is
+    attached to a note as an AdvancementNoteImage and the part file removed.
+    """
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('complete', 'Complete'),
+        ('attached', 'Attached'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='image_upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # Optional SHA-256 announced by the client, checked on finalize.
+    checksum = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    advancement_note_image = models.OneToOneField(
+        AdvancementNoteImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.filename} ({self.received}/{self.size}, {self.status})"
+
 class Notification(models.Model):
     RECIPIENT_TYPE_CHOICES = [
         ('Role', 'Role'), 
@@ -186,6 +369,8 @@ class Notification(models.Model):
         choices=NOTIFICATION_CATEGORY_CHOICES, 
         default='GENERAL'
     )
+    # Set when delivered from the outbox, so a redelivered entry cannot create duplicates.
+    dedup_key = models.CharField(max_length=120, unique=True, null=True, blank=True)
 
     def __str__(self):
         target_info = ""
@@ -202,110 +387,296 @@ class Notification(models.Model):
 
         return f"Notification ({self.get_notification_category_display()}): {self.message[:50]}... {target_info} {related_info}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the unread counters can tell when `read` flips on save.
+        instance._loaded_read = instance.read if 'read' in field_names else None
+        return instance
+
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['recipient_user', 'read', '-timestamp'], name='notif_user_read_ts_idx'),
+            models.Index(fields=['recipient_type', 'recipient_role', '-timestamp'], name='notif_type_role_ts_idx'),
+        ]
 
-def check_and_trigger_preventive_tasks(ordre_imputation_instance):
-    defined_thresholds = sorted(list(
-        PreventiveTaskTemplate.objects.filter(ordre_imputation=ordre_imputation_instance)
-                                      .values_list('trigger_hours', flat=True)
-                                      .distinct()
-    ))
-    
-    if not defined_thresholds:
-        print(f"No preventive task templates found for OI {ordre_imputation_instance.value}. Skipping check.")
+class NotificationCounter(models.Model):
+    """Denormalized number of unread notifications visible to a user."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username}: {self.unread_count} unread"
+
+def visible_notifications_q(user, role):
+    return Q(recipient_type='Role', recipient_role=role) | Q(recipient_type='UserInRole', recipient_user=user, recipient_role=role)
+
+def recount_unread_notifications(user):
+    role = user.profile.role if hasattr(user, 'profile') else None
+    unread = Notification.objects.filter(visible_notifications_q(user, role), read=False).count() if role else 0
+    NotificationCounter.objects.update_or_create(user=user, defaults={'unread_count': unread})
+    return unread
+
+def get_unread_notification_count(user):
+    unread = NotificationCounter.objects.filter(user=user).values_list('unread_count', flat=True).first()
+    if unread is None:
+        unread = recount_unread_notifications(user)
+    return unread
+
+def adjust_unread_counters(recipient_type, recipient_role, recipient_user_id, delta):
+    """Applies `delta` to the counters of every user who can see such a notification."""
+    if not delta or not recipient_role:
         return
+    counters = NotificationCounter.objects.filter(user__profile__role=recipient_role)
+    if recipient_type == 'UserInRole':
+        if not recipient_user_id:
+            return
+        counters = counters.filter(user_id=recipient_user_id)
+    elif recipient_type != 'Role':
+        return
+    counters.update(unread_count=F('unread_count') + delta)
 
-    current_total_hours = ordre_imputation_instance.total_hours_of_work
-    last_notified_actual_threshold = ordre_imputation_instance.last_notified_threshold or 0
-    
-    # Generate all possible future trigger points based on a 1600-hour cycle
-    all_trigger_points = []
-    base_thresholds = [t for t in defined_thresholds if t > 0]
-    
-    # Determine the number of cycles to check, going a bit beyond the current hours.
-    max_hours_to_check = float(current_total_hours) + 2000.0 
-    
-    k = 0
-    while True:
-        cycle_base = k * 1600
-        generated_a_trigger_in_cycle = False
-        for thresh in base_thresholds:
-            trigger = cycle_base + thresh
-            if trigger > max_hours_to_check and k > 0:
-                break
-            all_trigger_points.append(trigger)
-            generated_a_trigger_in_cycle = True
-        
-        if not generated_a_trigger_in_cycle or (cycle_base > max_hours_to_check and k > 0) :
-            break
-        k += 1
+def mark_notifications_read(queryset):
+    """Bulk mark-as-read that keeps the unread counters in step; returns the number updated."""
+    unread = queryset.filter(read=False)
+    groups = list(
+        unread.order_by().values('recipient_type', 'recipient_role', 'recipient_user_id').annotate(total=Count('id'))
+    )
+    count = Notification.objects.filter(pk__in=unread.values('pk')).update(read=True)
+    for group in groups:
+        adjust_unread_counters(group['recipient_type'], group['recipient_role'], group['recipient_user_id'], -group['total'])
+    return count
+
+class NotificationOutbox(models.Model):
+    """
+    With NOTIFICATION_DELIVERY = 'outbox': notifications raised by a request,
+    stored in the request's transaction and turned into Notification rows later
+    by the `process_notification_outbox` worker.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    dedup_key = models.CharField(max_length=100, unique=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
 
-    all_trigger_points = sorted(list(set(all_trigger_points)))
+    def __str__(self):
+        return f"Outbox {self.dedup_key} ({self.status}, {len(self.payload)} notifications)"
 
-    actual_threshold_to_warn_for = None
-    template_trigger_hours = None
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+class ReportJob(models.Model):
+    """
+    An admin task report generated in the background (see backend/report_jobs.py).
+    `cache_key` covers the normalized filters and the state of the tasks in
+    scope, so a finished job is reused by identical requests until those tasks change.
+    """
+    FORMAT_CHOICES = [
+        ('pdf', 'PDF'),
+        ('json', 'JSON'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
 
-    for full_threshold_value in all_trigger_points:
-        warning_trigger_point = full_threshold_value * 0.90
-        
-        if current_total_hours >= warning_trigger_point and full_threshold_value > last_notified_actual_threshold:
-            actual_threshold_to_warn_for = full_threshold_value
-            # Determine which template to use
-            template_trigger_hours = full_threshold_value % 1600
-            if template_trigger_hours == 0:
-                template_trigger_hours = 1600
-            
-            if template_trigger_hours not in defined_thresholds:
-                continue
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    output_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='pdf')
+    filters = models.JSONField(default=dict)
+    cache_key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    result = models.FileField(upload_to='reports/%Y/%m/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
-            break
+    def __str__(self):
+        return f"Report job {self.pk} ({self.output_format}, {self.status})"
 
-    if actual_threshold_to_warn_for and template_trigger_hours:
-        templates_for_trigger = PreventiveTaskTemplate.objects.filter(
-            ordre_imputation=ordre_imputation_instance, 
-            trigger_hours=template_trigger_hours
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='report_job_status_idx'),
+        ]
+
+class CollectionVersion(models.Model):
+    """Monotonic change counter per reference-data collection, used for ETags."""
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+def get_collection_version(name):
+    return CollectionVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+def bump_collection_version(name):
+    if not CollectionVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=timezone.now()):
+        CollectionVersion.objects.get_or_create(name=name)
+        CollectionVersion.objects.filter(name=name).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+class SyncTombstone(models.Model):
+    """Records a deleted row so incremental sync clients can drop it locally."""
+    MODEL_CHOICES = [
+        ('task', 'Task'),
+        ('advancement_note', 'Advancement Note'),
+        ('ordre_imputation', 'Ordre Imputation'),
+    ]
+
+    model_name = models.CharField(max_length=30, choices=MODEL_CHOICES)
+    object_id = models.CharField(max_length=100)
+    # Chef de Parc the deleted row was visible to; null means visible to everyone.
+    scope_profile_id = models.IntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Deleted {self.model_name} {self.object_id} at {self.deleted_at}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['scope_profile_id', 'deleted_at'], name='tombstone_scope_deleted_idx'),
+        ]
+
+PREVENTIVE_CYCLE_HOURS = 1600  # default; settings.PREVENTIVE_CYCLE_HOURS overrides it
+PREVENTIVE_WARNING_RATIO = Decimal('0.90')
+
+
+def get_preventive_cycle_hours():
+    return getattr(settings, 'PREVENTIVE_CYCLE_HOURS', PREVENTIVE_CYCLE_HOURS)
+
+
+def template_hours_for_threshold(threshold, cycle_length=None):
+    """Maps an absolute threshold (e.g. 2000h) onto its template's trigger hours (400h)."""
+    cycle_length = cycle_length or get_preventive_cycle_hours()
+    return threshold % cycle_length or cycle_length
+
+
+def compute_next_preventive_threshold(defined_thresholds, last_notified_threshold, cycle_length=None):
+    """
+    Smallest trigger point of the repeating maintenance cycle above
+    `last_notified_threshold` that maps back onto a defined template, or None.
+    Warning points grow with the threshold, so this is the only point the next
+    hours update can cross.
+    """
+    cycle_length = cycle_length or get_preventive_cycle_hours()
+    defined = set(defined_thresholds)
+    last = last_notified_threshold or 0
+    candidates = []
+    for thresh in defined:
+        if thresh <= 0 or template_hours_for_threshold(thresh, cycle_length) not in defined:
+            continue
+        cycles = max(0, (last - thresh) // cycle_length + 1)
+        candidates.append(thresh + cycles * cycle_length)
+    return min(candidates) if candidates else None
+
+
+def refresh_next_preventive_trigger(ordre_imputation_instance, schedule=None, save=True):
+    """Recomputes and stores the OI's next preventive threshold and its warning point."""
+    if schedule is None:
+        # Imported here: the schedule cache module depends on these models.
+        from .preventive import get_preventive_schedule
+        schedule = get_preventive_schedule(ordre_imputation_instance.pk)
+    next_threshold = schedule.next_threshold(ordre_imputation_instance.last_notified_threshold)
+    ordre_imputation_instance.next_preventive_threshold = next_threshold
+    ordre_imputation_instance.next_preventive_warning_hours = (
+        (next_threshold * PREVENTIVE_WARNING_RATIO).quantize(Decimal('0.01')) if next_threshold is not None else None
+    )
+    if save:
+        # queryset update: no post_save round trip, so bump the sync markers here.
+        OrdreImputation.objects.filter(pk=ordre_imputation_instance.pk).update(
+            next_preventive_threshold=ordre_imputation_instance.next_preventive_threshold,
+            next_preventive_warning_hours=ordre_imputation_instance.next_preventive_warning_hours,
+            updated_at=timezone.now()
         )
+        bump_collection_version('ordres_imputation')
+    return next_threshold
+
+
+def get_ois_approaching_preventive_threshold(within_hours=0):
+    """
+    OIs whose next warning point is at most `within_hours` away (already crossed
+    ones included), as one range scan over oi_hours_to_warning_idx.
+    """
+    return OrdreImputation.objects.alias(
+        hours_to_warning=F('next_preventive_warning_hours') - F('total_hours_of_work')
+    ).filter(hours_to_warning__lte=within_hours)
+
+
+def check_and_trigger_preventive_tasks(ordre_imputation_instance):
+    # Imported here: the schedule cache module depends on these models.
+    from .preventive import get_preventive_schedule
+
+    if ordre_imputation_instance.next_preventive_threshold is None:
+        # Not computed yet (or no templates): resolve it from the cached schedule.
+        refresh_next_preventive_trigger(ordre_imputation_instance)
+    if ordre_imputation_instance.next_preventive_threshold is None:
+        print(f"No preventive task templates found for OI {ordre_imputation_instance.value}. Skipping check.")
+        return
 
-        if templates_for_trigger.exists():
-            checklist_items = [f"- {tmpl.description}" for tmpl in templates_for_trigger]
+    current_total_hours = Decimal(ordre_imputation_instance.total_hours_of_work)
+    if current_total_hours < ordre_imputation_instance.next_preventive_warning_hours:
+        return
+
+    schedule = get_preventive_schedule(ordre_imputation_instance.pk)
+    actual_threshold_to_warn_for = ordre_imputation_instance.next_preventive_threshold
+    template_trigger_hours = schedule.template_hours(actual_threshold_to_warn_for)
+
+    if actual_threshold_to_warn_for and template_trigger_hours:
+        checklist = schedule.checklist(actual_threshold_to_warn_for)
+
+        if checklist:
+            checklist_items = [f"- {description}" for description in checklist]
             checklist_message = (
                 f"Alerte Anticipée: Maintenance Préventive pour OI '{ordre_imputation_instance.value}' "
                 f"(approche les {actual_threshold_to_warn_for}h de service).\n"
                 f"Veuillez vous préparer pour les tâches suivantes:\n" + "\n".join(checklist_items)
             )
             
+            # Imported here: the dispatcher module depends on these models.
+            from .notifications import NotificationDispatcher
+            dispatcher = NotificationDispatcher.current()
+            owns_dispatcher = dispatcher is None
+            if owns_dispatcher:
+                # Keyed on the hours update being handled, not on the threshold alone: after a meter
+                # reset or a corrected last_notified_threshold the same threshold must warn again.
+                warning_key = hashlib.sha1(
+                    f"{ordre_imputation_instance.pk}:{actual_threshold_to_warn_for}:"
+                    f"{ordre_imputation_instance.updated_at.isoformat()}".encode()
+                ).hexdigest()
+                dispatcher = NotificationDispatcher(dedup_key=f"preventive:{warning_key}")
+
             recipients_notified_count = 0
-            
-            admin_profiles = UserProfile.objects.filter(role='Admin')
-            for admin_profile in admin_profiles:
-                if admin_profile.user:
-                    Notification.objects.create(
-                        message=checklist_message,
-                        recipient_type='UserInRole', 
-                        recipient_role='Admin',
-                        recipient_user=admin_profile.user,
-                        notification_category='PREVENTIVE_CHECKLIST',
-                        ordre_imputation_related=ordre_imputation_instance
-                    )
-                    recipients_notified_count +=1
-            
-            chef_profiles = UserProfile.objects.filter(role='Chef de Parc')
-            for chef_profile in chef_profiles:
-                if chef_profile.user:
-                    Notification.objects.create(
-                        message=checklist_message, 
-                        recipient_type='UserInRole',
-                        recipient_role='Chef de Parc',
-                        recipient_user=chef_profile.user,
-                        notification_category='PREVENTIVE_CHECKLIST',
-                        ordre_imputation_related=ordre_imputation_instance
-                    )
-                    recipients_notified_count +=1
+            for role in ('Admin', 'Chef de Parc'):
+                recipients_notified_count += dispatcher.notify_role(
+                    role,
+                    message=checklist_message,
+                    category='PREVENTIVE_CHECKLIST',
+                    ordre_imputation_id=ordre_imputation_instance.pk
+                )
+            if owns_dispatcher:
+                dispatcher.dispatch()
             
             if recipients_notified_count > 0:
                 ordre_imputation_instance.last_notified_threshold = actual_threshold_to_warn_for
                 ordre_imputation_instance.save(update_fields=['last_notified_threshold'])
+                refresh_next_preventive_trigger(ordre_imputation_instance, schedule)
                 print(f"Advance preventive task warnings triggered for OI {ordre_imputation_instance.value} approaching {actual_threshold_to_warn_for}h. Notified {recipients_notified_count} users.")
             else:
                 print(f"Advance preventive tasks found for OI {ordre_imputation_instance.value} approaching {actual_threshold_to_warn_for}h, but no Admin or Chef de Parc users found to notify.")
@@ -313,20 +684,214 @@ def check_and_trigger_preventive_tasks(ordre_imputation_instance):
             print(f"OI {ordre_imputation_instance.value} is approaching {actual_threshold_to_warn_for}h (90% warning point crossed), but no preventive task templates found for this specific threshold.")
             ordre_imputation_instance.last_notified_threshold = actual_threshold_to_warn_for
             ordre_imputation_instance.save(update_fields=['last_notified_threshold'])
+            refresh_next_preventive_trigger(ordre_imputation_instance, schedule)
+
+@receiver(post_save, sender=OrdreImputation)
+def record_hour_meter_reading(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'total_hours_of_work' not in update_fields:
+        return
+    hours = Decimal(str(instance.total_hours_of_work))
+    loaded_hours = getattr(instance, '_loaded_total_hours', None)
+    if (created and not hours) or (not created and loaded_hours is not None and hours == loaded_hours):
+        return
+    HourMeterReading.objects.create(ordre_imputation=instance, reading=hours)
+    instance._loaded_total_hours = hours
+
+
+class PendingOIHours:
+    """
+    OI hour updates raised by Task saves, applied once the transaction commits.
+
+    Saves inside one transaction are coalesced per OI (the last saved task
+    wins) and applied by a single flush. Only task ids are queued: the flush
+    re-reads their committed hours, so entries left behind by a rolled-back
+    transaction cannot apply uncommitted values.
+    """
+    _local = threading.local()
+
+    @classmethod
+    def schedule(cls, ordre_value, task_id):
+        pending = getattr(cls._local, 'pending', None)
+        if pending is None:
+            pending = cls._local.pending = {}
+        pending[ordre_value] = task_id
+        # Registered per save: a rolled-back transaction drops its callbacks,
+        # so the next transaction must bring its own. Extra flushes are no-ops.
+        transaction.on_commit(cls.flush, robust=True)
+
+    @classmethod
+    def flush(cls):
+        pending, cls._local.pending = getattr(cls._local, 'pending', None), None
+        if not pending:
+            return
+        # Task.ordre points at OrdreImputation.value.
+        hours_by_oi = {
+            ordre_value: hours
+            for task_id, ordre_value, hours in Task.objects.filter(pk__in=pending.values())
+                                                            .values_list('pk', 'ordre_id', 'hours_of_work')
+            if hours is not None and pending.get(ordre_value) == task_id
+        }
+        # Imported here: the dispatcher module depends on these models.
+        from .notifications import NotificationDispatcher
+        with transaction.atomic(), NotificationDispatcher.collect():
+            for oi in OrdreImputation.objects.filter(value__in=hours_by_oi):
+                if oi.total_hours_of_work == hours_by_oi[oi.value]:
+                    continue
+                oi.total_hours_of_work = hours_by_oi[oi.value]
+                oi.save(update_fields=['total_hours_of_work'])
+                check_and_trigger_preventive_tasks(oi)
+
 
 @receiver(post_save, sender=Task)
-def update_oi_total_hours_on_task_save(sender, instance, created, **kwargs):
-    if instance.ordre and instance.hours_of_work is not None:
-        oi = instance.ordre
-        new_total_hours_for_oi = instance.hours_of_work 
-        
-        if oi.total_hours_of_work != new_total_hours_for_oi:
-            oi.total_hours_of_work = new_total_hours_for_oi
-            oi.save(update_fields=['total_hours_of_work']) 
-            check_and_trigger_preventive_tasks(oi)
+def update_oi_total_hours_on_task_save(sender, instance, created, update_fields=None, **kwargs):
+    if not instance.ordre_id or instance.hours_of_work is None:
+        return
+    if update_fields is not None and not {'hours_of_work', 'ordre'} & set(update_fields):
+        return
+    unchanged = (
+        not created
+        and getattr(instance, '_loaded_hours_of_work', None) == instance.hours_of_work
+        and getattr(instance, '_loaded_ordre_id', None) == instance.ordre_id
+    )
+    # Status / closed_at / text edits keep the same hours: nothing to propagate.
+    if not unchanged:
+        PendingOIHours.schedule(instance.ordre_id, instance.pk)
+    instance._loaded_hours_of_work = instance.hours_of_work
+    instance._loaded_ordre_id = instance.ordre_id
 
 
 @receiver(post_save, sender=Task)
 def ensure_task_id_display(sender, instance, created, **kwargs):
     if created and not instance.task_id_display:
-        generate_task_id_display(instance)
\ No newline at end of file
+        generate_task_id_display(instance)
+
+
+@receiver(post_delete, sender=Task)
+def record_task_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.create(
+        model_name='task',
+        object_id=str(instance.pk),
+        scope_profile_id=instance.assigned_to_profile_id
+    )
+
+
+@receiver(post_save, sender=Task)
+def record_task_reassignment_tombstones(sender, instance, created, **kwargs):
+    """
+    A reassigned task (and its notes) leaves the previous Chef de Parc's sync
+    scope without being deleted, so it gets tombstones scoped to them. The
+    notes are touched so the new assignee's next incremental sync picks them up.
+    """
+    previous_profile_id = getattr(instance, '_loaded_assigned_to_profile_id', instance.assigned_to_profile_id)
+    instance._loaded_assigned_to_profile_id = instance.assigned_to_profile_id
+    if created or previous_profile_id == instance.assigned_to_profile_id:
+        return
+
+    note_ids = [str(pk) for pk in AdvancementNote.objects.filter(task_id=instance.pk).values_list('pk', flat=True)]
+    if previous_profile_id is not None:
+        SyncTombstone.objects.bulk_create(
+            [SyncTombstone(model_name='task', object_id=str(instance.pk), scope_profile_id=previous_profile_id)]
+            + [SyncTombstone(model_name='advancement_note', object_id=note_id, scope_profile_id=previous_profile_id)
+               for note_id in note_ids]
+        )
+    if instance.assigned_to_profile_id is not None:
+        # Handed back to an earlier assignee: their old tombstones would now delete visible rows.
+        SyncTombstone.objects.filter(scope_profile_id=instance.assigned_to_profile_id).filter(
+            Q(model_name='task', object_id=str(instance.pk)) | Q(model_name='advancement_note', object_id__in=note_ids)
+        ).delete()
+    AdvancementNote.objects.filter(task_id=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=AdvancementNote)
+def record_advancement_note_tombstone(sender, instance, **kwargs):
+    scope_profile_id = Task.objects.filter(pk=instance.task_id).values_list('assigned_to_profile_id', flat=True).first()
+    SyncTombstone.objects.create(
+        model_name='advancement_note',
+        object_id=str(instance.pk),
+        scope_profile_id=scope_profile_id
+    )
+
+
+@receiver(post_delete, sender=OrdreImputation)
+def record_ordre_imputation_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.create(model_name='ordre_imputation', object_id=str(instance.pk))
+
+
+@receiver(post_save, sender=AdvancementNote)
+def touch_task_on_note_save(sender, instance, **kwargs):
+    # Keeps the task's note/image counts fresh for incremental sync clients.
+    Task.objects.filter(pk=instance.task_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=AdvancementNoteImage)
+def process_advancement_image_on_upload(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    if created or instance.image.name != getattr(instance, '_loaded_image_name', instance.image.name):
+        # Imported here: the images module depends on these models.
+        from .images import enqueue_image_processing
+        if not created:
+            AdvancementNoteImage.objects.filter(pk=instance.pk).update(processing_status='pending')
+        # After commit: the worker reads the row and the stored upload from another process.
+        transaction.on_commit(lambda: enqueue_image_processing([instance.pk]))
+
+
+@receiver(post_save, sender=PreventiveTaskTemplate)
+@receiver(post_delete, sender=PreventiveTaskTemplate)
+def refresh_next_preventive_trigger_on_template_change(sender, instance, **kwargs):
+    # Imported here: the schedule cache module depends on these models.
+    from .preventive import invalidate_preventive_schedule
+    # A template moved to another OI changes both schedules.
+    oi_ids = {instance.ordre_imputation_id, getattr(instance, '_loaded_ordre_imputation_id', None)} - {None}
+    for oi in OrdreImputation.objects.filter(pk__in=oi_ids):
+        invalidate_preventive_schedule(oi.pk)
+        refresh_next_preventive_trigger(oi)
+
+
+VERSIONED_COLLECTIONS = {
+    Technician: 'technicians',
+    OrdreImputation: 'ordres_imputation',
+    PreventiveTaskTemplate: 'preventive_task_templates',
+    UserProfile: 'user_profiles',
+}
+
+def bump_reference_collection_version(sender, **kwargs):
+    bump_collection_version(VERSIONED_COLLECTIONS[sender])
+
+for versioned_model in VERSIONED_COLLECTIONS:
+    post_save.connect(bump_reference_collection_version, sender=versioned_model)
+    post_delete.connect(bump_reference_collection_version, sender=versioned_model)
+
+
+@receiver(post_save, sender=User)
+def bump_user_profiles_version_on_user_save(sender, instance, update_fields=None, **kwargs):
+    # Profiles are serialized with their user's name and email; a login only stamps last_login.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_collection_version('user_profiles')
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_counters_on_notification_save(sender, instance, created, **kwargs):
+    if created:
+        delta = 0 if instance.read else 1
+    else:
+        was_read = getattr(instance, '_loaded_read', None)
+        if was_read is None or was_read == instance.read:
+            delta = 0
+        else:
+            delta = -1 if instance.read else 1
+    instance._loaded_read = instance.read
+    adjust_unread_counters(instance.recipient_type, instance.recipient_role, instance.recipient_user_id, delta)
+
+
+@receiver(post_delete, sender=Notification)
+def update_unread_counters_on_notification_delete(sender, instance, **kwargs):
+    if not instance.read:
+        adjust_unread_counters(instance.recipient_type, instance.recipient_role, instance.recipient_user_id, -1)
+
+
+@receiver(post_save, sender=UserProfile)
+def reset_notification_counter_on_profile_save(sender, instance, **kwargs):
+    # A role change changes which notifications are visible; recount lazily on next read.
+    NotificationCounter.objects.filter(user_id=instance.user_id).delete()
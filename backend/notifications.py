@@ -0,0 +1,220 @@
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import Notification, NotificationCounter, NotificationOutbox, UserProfile, Task, OrdreImputation
+
+OUTBOX_PAYLOAD_FIELDS = (
+    'message', 'recipient_type', 'recipient_role', 'recipient_user_id',
+    'notification_category', 'task_related_id', 'ordre_imputation_related_id',
+)
+
+
+def use_outbox():
+    # 'inline' (default): written with bulk_create when the request's transaction commits.
+    # 'outbox': delivered by the process_notification_outbox worker, which must then be running;
+    # without it notifications pile up undelivered in NotificationOutbox.
+    return getattr(settings, 'NOTIFICATION_DELIVERY', 'inline') == 'outbox'
+
+
+class NotificationDispatcher:
+    """
+    Collects the notifications raised while handling one event or request.
+    `dispatch()` writes the batch with a single `bulk_create` once the
+    transaction commits (or, with NOTIFICATION_DELIVERY = 'outbox', stores it
+    as one NotificationOutbox row in the current transaction).
+
+    Views open a batch with `NotificationDispatcher.collect()`; code running
+    inside it (signals, model helpers) joins the same batch through
+    `NotificationDispatcher.current()`. Recipients are resolved once per role
+    and related objects are referenced by id, so fan-out costs no lookups.
+    """
+    _local = threading.local()
+
+    def __init__(self, dedup_key=None):
+        self.pending = []
+        self.dedup_key = dedup_key
+        self._role_user_ids = {}
+
+    @classmethod
+    @contextmanager
+    def collect(cls, dedup_key=None):
+        dispatcher = cls(dedup_key)
+        previous = getattr(cls._local, 'active', None)
+        cls._local.active = dispatcher
+        try:
+            yield dispatcher
+        finally:
+            cls._local.active = previous
+        dispatcher.dispatch()
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, 'active', None)
+
+    def role_user_ids(self, role):
+        if role not in self._role_user_ids:
+            self._role_user_ids[role] = list(
+                UserProfile.objects.filter(role=role, user__isnull=False).values_list('user_id', flat=True)
+            )
+        return self._role_user_ids[role]
+
+    def notify_user(self, user_id, role, message, category, task_id=None, ordre_imputation_id=None):
+        if not user_id:
+            return 0
+        self.pending.append(Notification(
+            message=message,
+            recipient_type='UserInRole',
+            recipient_role=role,
+            recipient_user_id=user_id,
+            notification_category=category,
+            task_related_id=task_id,
+            ordre_imputation_related_id=ordre_imputation_id
+        ))
+        return 1
+
+    def notify_role(self, role, message, category, task_id=None, ordre_imputation_id=None, exclude_user_ids=()):
+        """Queues one notification per user holding `role`; returns how many were queued."""
+        queued = 0
+        for user_id in self.role_user_ids(role):
+            if user_id in exclude_user_ids:
+                continue
+            queued += self.notify_user(user_id, role, message, category, task_id, ordre_imputation_id)
+        return queued
+
+    def dispatch(self):
+        if not self.pending:
+            return
+        if use_outbox():
+            self.write_outbox()
+        else:
+            transaction.on_commit(self.flush)
+
+    def write_outbox(self):
+        notifications, self.pending = self.pending, []
+        payload = [
+            {field: getattr(notification, field) for field in OUTBOX_PAYLOAD_FIELDS}
+            for notification in notifications
+        ]
+        dedup_key = self.dedup_key or uuid.uuid4().hex
+        NotificationOutbox.objects.get_or_create(dedup_key=dedup_key, defaults={'payload': payload})
+
+    def flush(self):
+        notifications, self.pending = self.pending, []
+        if not notifications:
+            return []
+        created = Notification.objects.bulk_create(notifications)
+        self.update_unread_counters(created)
+        return created
+
+    @staticmethod
+    def update_unread_counters(notifications):
+        # bulk_create skips post_save, so the unread counters are bumped here:
+        # one UPDATE per (role, increment) group rather than one per recipient.
+        per_user = {}
+        for notification in notifications:
+            if notification.read or not notification.recipient_user_id:
+                continue
+            key = (notification.recipient_role, notification.recipient_user_id)
+            per_user[key] = per_user.get(key, 0) + 1
+
+        groups = {}
+        for (role, user_id), increment in per_user.items():
+            groups.setdefault((role, increment), []).append(user_id)
+        for (role, increment), user_ids in groups.items():
+            NotificationCounter.objects.filter(user_id__in=user_ids, user__profile__role=role) \
+                                       .update(unread_count=F('unread_count') + increment)
+
+
+def deliver_outbox_entry(entry):
+    """
+    Creates the Notification rows of one outbox entry. Safe to repeat: every
+    row carries `<entry key>:<index>` as its dedup key and rows that already
+    exist are skipped.
+    """
+    items = [(f"{entry.dedup_key}:{index}", item) for index, item in enumerate(entry.payload)]
+    existing = set(
+        Notification.objects.filter(dedup_key__in=[key for key, _ in items]).values_list('dedup_key', flat=True)
+    )
+    # Users, tasks or OIs deleted since the event was recorded would break the
+    # (deferred) foreign keys at commit time, so such rows are dropped up front.
+    live_ids = {}
+    for field, model in (('recipient_user_id', User), ('task_related_id', Task), ('ordre_imputation_related_id', OrdreImputation)):
+        ids = {item[field] for _, item in items if item.get(field)}
+        live_ids[field] = set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+    notifications = []
+    for key, item in items:
+        if key in existing:
+            continue
+        if any(item.get(field) and item[field] not in live_ids[field] for field in live_ids):
+            continue
+        notifications.append(Notification(dedup_key=key, **{field: item.get(field) for field in OUTBOX_PAYLOAD_FIELDS}))
+
+    created = Notification.objects.bulk_create(notifications)
+    NotificationDispatcher.update_unread_counters(created)
+    return len(created)
+
+
+def outbox_retry_delay(attempts):
+    base = getattr(settings, 'NOTIFICATION_OUTBOX_RETRY_BASE_SECONDS', 5)
+    cap = getattr(settings, 'NOTIFICATION_OUTBOX_RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), cap))
+
+
+def process_outbox_batch(batch_size=100, max_attempts=8):
+    """
+    Delivers up to `batch_size` due outbox entries; returns (delivered, failed).
+
+    Each entry is delivered in its own savepoint. A failure schedules a retry
+    with exponential backoff and, after `max_attempts`, parks the entry as
+    'failed' for inspection.
+    """
+    delivered = failed = 0
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+                                      .filter(status='pending', next_attempt_at__lte=now)
+                                      .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    deliver_outbox_entry(entry)
+            except Exception as e:
+                entry.attempts += 1
+                entry.last_error = str(e)
+                entry.next_attempt_at = now + outbox_retry_delay(entry.attempts)
+                if entry.attempts >= max_attempts:
+                    entry.status = 'failed'
+                entry.save(update_fields=['attempts', 'last_error', 'next_attempt_at', 'status'])
+                failed += 1
+                continue
+            entry.status = 'done'
+            entry.processed_at = timezone.now()
+            entry.save(update_fields=['status', 'processed_at'])
+            delivered += 1
+    return delivered, failed
+
+
+def get_outbox_backlog():
+    """Backlog metric: pending entries, how long the oldest has waited, and parked failures."""
+    pending = NotificationOutbox.objects.filter(status='pending')
+    oldest = pending.aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'pending': pending.count(),
+        'oldest_pending_age_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+        'failed': NotificationOutbox.objects.filter(status='failed').count(),
+    }
+
+
+def purge_delivered_outbox(older_than):
+    return NotificationOutbox.objects.filter(status='done', processed_at__lt=older_than).delete()[0]
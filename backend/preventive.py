@@ -0,0 +1,318 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    HourMeterReading,
+    OrdreImputation,
+    PreventiveTaskTemplate,
+    bump_collection_version,
+    compute_next_preventive_threshold,
+    get_preventive_cycle_hours,
+    refresh_next_preventive_trigger,
+    template_hours_for_threshold,
+)
+from .notifications import NotificationDispatcher
+
+SCHEDULE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+class PreventiveSchedule:
+    """
+    Compiled preventive plan of one OI: the cycle length, its sorted template
+    thresholds and the checklist of each threshold.
+    """
+    __slots__ = ('cycle_length', 'thresholds', 'checklists')
+
+    def __init__(self, checklists, cycle_length):
+        self.cycle_length = cycle_length
+        self.checklists = {trigger_hours: tuple(items) for trigger_hours, items in checklists.items()}
+        self.thresholds = tuple(sorted(self.checklists))
+
+    def template_hours(self, threshold):
+        return template_hours_for_threshold(threshold, self.cycle_length)
+
+    def next_threshold(self, after):
+        return compute_next_preventive_threshold(self.thresholds, after, self.cycle_length)
+
+    def checklist(self, threshold):
+        return self.checklists.get(self.template_hours(threshold), ())
+
+
+class ScheduleLRU:
+    """Process-local LRU of compiled schedules, each tagged with the cache token it was built under."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, oi_id, token, max_age=None):
+        with self._lock:
+            entry = self._entries.get(oi_id)
+            if entry is None or entry[0] != token:
+                return None
+            if max_age is not None and time.monotonic() - entry[2] > max_age:
+                del self._entries[oi_id]
+                return None
+            self._entries.move_to_end(oi_id)
+            return entry[1]
+
+    def put(self, oi_id, token, schedule):
+        with self._lock:
+            self._entries[oi_id] = (token, schedule, time.monotonic())
+            self._entries.move_to_end(oi_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, oi_id):
+        with self._lock:
+            self._entries.pop(oi_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+schedule_lru = ScheduleLRU(getattr(settings, 'PREVENTIVE_SCHEDULE_LRU_SIZE', 1024))
+
+
+def schedule_cache_is_shared():
+    # LocMemCache (Django's default) and DummyCache live in one process: a token
+    # rotated by the worker that saved a template is never seen by the others.
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def get_local_schedule_ttl():
+    return getattr(settings, 'PREVENTIVE_SCHEDULE_LOCAL_TTL', 30)
+
+
+def _schedule_cache_key(oi_id):
+    # id_ordre is free text; hash it into a key every cache backend accepts.
+    return "preventive-schedule:" + hashlib.sha1(str(oi_id).encode()).hexdigest()
+
+
+def compile_preventive_schedules(oi_ids):
+    """Builds the schedules of the given OIs from their templates, in one query."""
+    checklists = {oi_id: {} for oi_id in oi_ids}
+    rows = PreventiveTaskTemplate.objects.filter(ordre_imputation_id__in=oi_ids) \
+                                         .order_by('trigger_hours', 'id') \
+                                         .values_list('ordre_imputation_id', 'trigger_hours', 'description')
+    for oi_id, trigger_hours, description in rows:
+        checklists[oi_id].setdefault(trigger_hours, []).append(description)
+    cycle_length = get_preventive_cycle_hours()
+    return {oi_id: PreventiveSchedule(items, cycle_length) for oi_id, items in checklists.items()}
+
+
+def get_preventive_schedules(oi_ids):
+    """
+    {oi id: PreventiveSchedule} for the given OIs.
+
+    Lookups go process LRU -> shared cache -> one template query for whatever
+    is left. Each OI has a token in the shared cache that template changes
+    replace; schedules are stored under it, so every process drops stale
+    copies without any cross-process messaging.
+
+    That needs a cache shared by all processes (Redis, Memcached, database).
+    With a process-local one the cache is skipped and LRU entries are rebuilt
+    after PREVENTIVE_SCHEDULE_LOCAL_TTL seconds instead, so another worker's
+    template edit shows up within that delay.
+    """
+    oi_ids = list(dict.fromkeys(oi_ids))
+    if not oi_ids:
+        return {}
+    shared = schedule_cache_is_shared()
+    max_age = None if shared else get_local_schedule_ttl()
+    base_keys = {oi_id: _schedule_cache_key(oi_id) for oi_id in oi_ids}
+    if shared:
+        tokens = cache.get_many([f"{key}:token" for key in base_keys.values()])
+        for oi_id, key in base_keys.items():
+            token_key = f"{key}:token"
+            if token_key not in tokens:
+                cache.add(token_key, uuid.uuid4().hex, timeout=None)
+                tokens[token_key] = cache.get(token_key)
+    else:
+        tokens = {f"{key}:token": 'local' for key in base_keys.values()}
+
+    schedules = {}
+    shared_keys = {}
+    for oi_id, key in base_keys.items():
+        token = tokens[f"{key}:token"]
+        schedule = schedule_lru.get(oi_id, token, max_age)
+        if schedule is not None:
+            schedules[oi_id] = schedule
+        else:
+            shared_keys[f"{key}:{token}:{get_preventive_cycle_hours()}"] = (oi_id, token)
+
+    if shared_keys and shared:
+        cached = cache.get_many(list(shared_keys))
+        for shared_key, schedule in cached.items():
+            oi_id, token = shared_keys.pop(shared_key)
+            schedules[oi_id] = schedule
+            schedule_lru.put(oi_id, token, schedule)
+
+    if shared_keys:
+        compiled = compile_preventive_schedules([oi_id for oi_id, _ in shared_keys.values()])
+        to_cache = {}
+        for shared_key, (oi_id, token) in shared_keys.items():
+            schedules[oi_id] = compiled[oi_id]
+            schedule_lru.put(oi_id, token, compiled[oi_id])
+            to_cache[shared_key] = compiled[oi_id]
+        if shared:
+            cache.set_many(to_cache, timeout=SCHEDULE_CACHE_TIMEOUT)
+    return schedules
+
+
+def get_preventive_schedule(oi_id):
+    return get_preventive_schedules([oi_id])[oi_id]
+
+
+def invalidate_preventive_schedule(oi_id):
+    """Drops the OI's schedule everywhere; repeated on commit so concurrent readers cannot re-cache the old rows."""
+    def rotate_token():
+        schedule_lru.discard(oi_id)
+        cache.set(f"{_schedule_cache_key(oi_id)}:token", uuid.uuid4().hex, timeout=None)
+    rotate_token()
+    transaction.on_commit(rotate_token)
+
+
+def evaluate_preventive_thresholds(ordres):
+    """
+    Batch version of check_and_trigger_preventive_tasks() for OIs whose hours
+    were just updated. Crossed warning points are reported in one digest
+    notification per Admin / Chef de Parc instead of one burst per OI.
+
+    Returns the list of (oi, threshold) warnings that were sent.
+    """
+    schedules = get_preventive_schedules([oi.pk for oi in ordres])
+    crossed = []
+    for oi in ordres:
+        if oi.next_preventive_threshold is None:
+            refresh_next_preventive_trigger(oi, schedules[oi.pk], save=False)
+        if oi.next_preventive_threshold is None:
+            continue
+        if Decimal(oi.total_hours_of_work) >= oi.next_preventive_warning_hours:
+            crossed.append((oi, oi.next_preventive_threshold))
+    if not crossed:
+        return []
+
+    sections = []
+    for oi, threshold in crossed:
+        checklist = schedules[oi.pk].checklist(threshold)
+        sections.append(
+            f"OI '{oi.value}' (approche les {threshold}h de service):\n" + "\n".join(f"- {item}" for item in checklist)
+        )
+    message = (
+        f"Alerte Anticipée: Maintenance Préventive pour {len(crossed)} OI(s) après un relevé d'heures groupé.\n"
+        f"Veuillez vous préparer pour les tâches suivantes:\n" + "\n\n".join(sections)
+    )
+    # updated_at identifies this batch of readings, so a threshold warned again after a reset gets a new key.
+    digest_key = hashlib.sha1(
+        ",".join(f"{oi.pk}:{threshold}:{oi.updated_at.isoformat()}" for oi, threshold in crossed).encode()
+    ).hexdigest()
+    dispatcher = NotificationDispatcher(dedup_key=f"preventive-digest:{digest_key}")
+    single_oi_id = crossed[0][0].pk if len(crossed) == 1 else None
+    recipients_notified_count = 0
+    for role in ('Admin', 'Chef de Parc'):
+        recipients_notified_count += dispatcher.notify_role(
+            role,
+            message=message,
+            category='PREVENTIVE_CHECKLIST',
+            ordre_imputation_id=single_oi_id
+        )
+    if not recipients_notified_count:
+        # Same rule as the per-OI check: keep the warning pending until someone can receive it.
+        return []
+    dispatcher.dispatch()
+
+    for oi, threshold in crossed:
+        oi.last_notified_threshold = threshold
+        refresh_next_preventive_trigger(oi, schedules[oi.pk], save=False)
+    return crossed
+
+
+def apply_hour_meter_readings(readings):
+    """
+    Applies validated hour-meter readings (dicts with `ordre_imputation`,
+    `reading` and `timestamp`) with set-based UPDATEs, appends them to the
+    HourMeterReading history, then evaluates the preventive thresholds of the
+    updated OIs in one batch.
+
+    When an OI appears several times, its most recent reading wins. A
+    reading older than the OI's newest recorded one (a late upload from a
+    backfilled log) only goes into the history: applying it would wind the
+    meter back and suppress the warnings already passed. Those OIs are
+    reported as `stale`.
+    """
+    latest = {}
+    for row in readings:
+        oi = row['ordre_imputation']
+        current = latest.get(oi.pk)
+        if current is None or row['timestamp'] >= current['timestamp']:
+            latest[oi.pk] = row
+
+    now = timezone.now()
+    changed = []
+    stale = []
+    warnings = []
+    with transaction.atomic():
+        # Re-read under lock: the instances resolved during validation may be outdated by now,
+        # and bulk_update writes every listed column.
+        ordres = OrdreImputation.objects.select_for_update().in_bulk(list(latest))
+        newest_recorded = dict(
+            HourMeterReading.objects.filter(ordre_imputation_id__in=list(latest))
+            .values('ordre_imputation_id').annotate(newest=Max('recorded_at'))
+            .values_list('ordre_imputation_id', 'newest')
+        )
+        for oi_id, row in latest.items():
+            oi = ordres[oi_id]
+            newest = newest_recorded.get(oi_id)
+            if newest is not None and row['timestamp'] < newest:
+                stale.append((oi, row, newest))
+                continue
+            if oi.total_hours_of_work == row['reading']:
+                continue
+            oi.total_hours_of_work = row['reading']
+            oi.updated_at = now
+            changed.append(oi)
+
+        # Every row goes into the history, repeated readings included: they show idle time.
+        HourMeterReading.objects.bulk_create([
+            HourMeterReading(ordre_imputation=row['ordre_imputation'], reading=row['reading'], recorded_at=row['timestamp'])
+            for row in readings
+        ], batch_size=500)
+        if changed:
+            warnings = evaluate_preventive_thresholds(changed)
+            OrdreImputation.objects.bulk_update(
+                changed,
+                ['total_hours_of_work', 'last_notified_threshold', 'next_preventive_threshold',
+                 'next_preventive_warning_hours', 'updated_at'],
+                batch_size=500
+            )
+            # bulk_update skips post_save, which normally bumps the reference data version.
+            bump_collection_version('ordres_imputation')
+
+    return {
+        'received': len(readings),
+        'ordres_imputation': len(latest),
+        'updated': len(changed),
+        'unchanged': len(latest) - len(changed) - len(stale),
+        'stale': [
+            {'ordre_imputation': oi.pk, 'reading': row['reading'], 'timestamp': row['timestamp'], 'newest_recorded_at': newest}
+            for oi, row, newest in stale
+        ],
+        'preventive_warnings': [
+            {'ordre_imputation': oi.pk, 'value': oi.value, 'threshold': threshold} for oi, threshold in warnings
+        ],
+    }
@@ -0,0 +1,166 @@
+"""
+Authenticated delivery of advancement note images.
+
+Django only decides whether the user may see the file; the bytes are sent by
+the front web server when MEDIA_SENDFILE_BACKEND is set:
+
+  'nginx'   X-Accel-Redirect: <MEDIA_ACCEL_REDIRECT_PREFIX><name>, with e.g.
+                location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+  'apache'  X-Sendfile: <absolute path> (mod_xsendfile, XSendFilePath <MEDIA_ROOT>)
+  None      Django streams the file itself (development only).
+
+The advancement image directories should then no longer be served under
+MEDIA_URL.
+
+<img> tags cannot send the Authorization header, so the endpoint also
+accepts a short-lived signed cookie scoped to its path, which clients get
+from POST /media-session/. Image URLs therefore carry no credential and stay
+the same for as long as the file does, which is what lets browsers keep them
+cached. A frontend on another origin must fetch /media-session/ with
+credentials (CORS_ALLOW_CREDENTIALS) and, if it is also on another site,
+needs MEDIA_SESSION_COOKIE_SAMESITE = 'None' over HTTPS.
+"""
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags
+from rest_framework import authentication, exceptions
+
+RENDITION_FIELDS = ('image', 'medium', 'thumbnail')
+CONTENT_ADDRESSED_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})\.\w+$')
+CONTENT_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif', '.webp': 'image/webp'}
+
+
+def get_sendfile_backend():
+    return getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+
+
+def get_accel_redirect_prefix():
+    return getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+
+def get_immutable_max_age():
+    return getattr(settings, 'MEDIA_IMMUTABLE_MAX_AGE', 365 * 24 * 3600)
+
+
+def get_access_token_max_age():
+    return getattr(settings, 'MEDIA_ACCESS_TOKEN_MAX_AGE', 6 * 3600)
+
+
+def get_media_session_cookie_name():
+    return getattr(settings, 'MEDIA_SESSION_COOKIE_NAME', 'note_media_session')
+
+
+def get_media_session_cookie_path():
+    # The cookie is only sent to the media endpoint, e.g. /api/note-images/.
+    sample = reverse('note-image-media', kwargs={'pk': 0, 'rendition': 'image', 'filename': 'x'})
+    return sample[:sample.index('/0/') + 1]
+
+
+def content_digest(name):
+    """The SHA-256 a content-addressed file name is built from, or None for legacy names."""
+    match = CONTENT_ADDRESSED_NAME_RE.search(name or '')
+    return match.group('digest') if match else None
+
+
+def _media_session_signer():
+    return signing.TimestampSigner(salt='note-image-media-session')
+
+
+def set_media_session_cookie(response, user):
+    """Gives `user` access to the media endpoint from this browser for MEDIA_ACCESS_TOKEN_MAX_AGE seconds."""
+    response.set_cookie(
+        get_media_session_cookie_name(),
+        _media_session_signer().sign(str(user.pk)),
+        max_age=get_access_token_max_age(),
+        path=get_media_session_cookie_path(),
+        secure=getattr(settings, 'SESSION_COOKIE_SECURE', False),
+        httponly=True,
+        samesite=getattr(settings, 'MEDIA_SESSION_COOKIE_SAMESITE', 'Lax'),
+    )
+    return response
+
+
+def delete_media_session_cookie(response):
+    response.delete_cookie(
+        get_media_session_cookie_name(), path=get_media_session_cookie_path(),
+        samesite=getattr(settings, 'MEDIA_SESSION_COOKIE_SAMESITE', 'Lax'),
+    )
+    return response
+
+
+def note_image_media_url(note_image, rendition):
+    """
+    Path of a rendition on the media endpoint, or None when it has not been
+    generated. The stored file name is part of the path, so a reprocessed
+    image gets a new URL and the old one can be cached for good.
+    """
+    field_file = getattr(note_image, rendition)
+    if not field_file:
+        return None
+    return reverse('note-image-media', kwargs={
+        'pk': note_image.pk, 'rendition': rendition, 'filename': posixpath.basename(field_file.name),
+    })
+
+
+class MediaSessionAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates media endpoint requests by the cookie of
+    set_media_session_cookie(). The endpoint only serves GETs, so no CSRF
+    check is needed; the ownership check still runs on every request.
+    """
+
+    def authenticate(self, request):
+        token = request.COOKIES.get(get_media_session_cookie_name())
+        if not token:
+            return None
+        try:
+            user_id = int(_media_session_signer().unsign(token, max_age=get_access_token_max_age()))
+            user = User.objects.select_related('profile').get(pk=user_id, is_active=True)
+        except (signing.BadSignature, ValueError, User.DoesNotExist):
+            raise exceptions.AuthenticationFailed("Session d'images expirée.")
+        return user, None
+
+
+def _cache_headers(response, name):
+    digest = content_digest(name)
+    if digest:
+        # The name is the hash of the bytes: the file behind this URL never changes.
+        response['Cache-Control'] = f'private, max-age={get_immutable_max_age()}, immutable'
+        response['ETag'] = f'"{digest}"'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def protected_file_response(request, field_file):
+    """
+    Response for a stored file the caller is allowed to see: 304 on a
+    matching If-None-Match, otherwise the file itself or, with
+    MEDIA_SENDFILE_BACKEND, an empty response telling the web server which
+    file to send.
+    """
+    name = field_file.name
+    digest = content_digest(name)
+    if digest and f'"{digest}"' in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        return _cache_headers(HttpResponse(status=304), name)
+
+    content_type = CONTENT_TYPES.get(os.path.splitext(name)[1].lower(), 'application/octet-stream')
+    backend = get_sendfile_backend()
+    if backend == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        # Quoted: a legacy name with spaces or accents would otherwise go out MIME-encoded.
+        response['X-Accel-Redirect'] = quote(get_accel_redirect_prefix() + name)
+    elif backend == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = field_file.path
+    else:
+        response = FileResponse(field_file.open('rb'), content_type=content_type)
+    return _cache_headers(response, name)
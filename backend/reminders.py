@@ -0,0 +1,81 @@
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OrdreImputation
+from .notifications import NotificationDispatcher
+
+REMINDER_ROLES = ('Chef de Parc', 'Admin')
+
+
+def get_cycle_visit_reminder_days():
+    return getattr(settings, 'CYCLE_VISIT_REMINDER_DAYS', 7)
+
+
+def due_cycle_visits(window_days, today=None, include_overdue=False):
+    """
+    OIs whose next cycle visit falls within `window_days` of today (and,
+    with `include_overdue`, visits already past) that have not been reminded
+    for that date yet. A range scan on oi_next_cycle_visit_idx.
+    """
+    today = today or timezone.localdate()
+    dates = Q(date_prochain_cycle_visite__lte=today + datetime.timedelta(days=window_days))
+    if not include_overdue:
+        dates &= Q(date_prochain_cycle_visite__gte=today)
+    return OrdreImputation.objects.filter(dates, date_prochain_cycle_visite__isnull=False).exclude(
+        cycle_visite_reminder_sent_for=F('date_prochain_cycle_visite')
+    )
+
+
+def cycle_visit_reminder_message(oi, today):
+    days = (oi.date_prochain_cycle_visite - today).days
+    if days < 0:
+        when = f"était prévue le {oi.date_prochain_cycle_visite} (en retard de {-days} jour(s))"
+    elif days == 0:
+        when = f"est prévue aujourd'hui ({oi.date_prochain_cycle_visite})"
+    else:
+        when = f"est prévue le {oi.date_prochain_cycle_visite} (dans {days} jour(s))"
+    return f"Rappel: la visite de cycle de l'OI '{oi.value}' {when}."
+
+
+def send_cycle_visit_reminders(window_days=None, today=None, include_overdue=False, batch_size=500, dry_run=False):
+    """
+    Sends one CYCLE_VISIT reminder per due OI to every Chef de Parc and Admin,
+    then records the reminded visit date on the OI so later runs skip it.
+
+    Works through the due OIs in batches; each batch is claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED, notified through one dispatcher and
+    marked with one UPDATE, so overlapping runs never double-send.
+    Returns the number of OIs reminded (or due, with `dry_run`).
+    """
+    window_days = get_cycle_visit_reminder_days() if window_days is None else window_days
+    today = today or timezone.localdate()
+    due = due_cycle_visits(window_days, today, include_overdue).order_by('date_prochain_cycle_visite', 'pk')
+    if dry_run:
+        return due.count()
+
+    reminded = 0
+    while True:
+        with transaction.atomic():
+            batch = list(due.select_for_update(skip_locked=True)[:batch_size])
+            if not batch:
+                break
+            key = hashlib.sha1(
+                ",".join(f"{oi.pk}:{oi.date_prochain_cycle_visite}" for oi in batch).encode()
+            ).hexdigest()
+            with NotificationDispatcher.collect(dedup_key=f"cycle-visit:{key}") as dispatcher:
+                for oi in batch:
+                    message = cycle_visit_reminder_message(oi, today)
+                    for role in REMINDER_ROLES:
+                        dispatcher.notify_role(role, message=message, category='CYCLE_VISIT', ordre_imputation_id=oi.pk)
+            OrdreImputation.objects.filter(pk__in=[oi.pk for oi in batch]).update(
+                cycle_visite_reminder_sent_for=F('date_prochain_cycle_visite')
+            )
+        reminded += len(batch)
+        if len(batch) < batch_size:
+            break
+    return reminded
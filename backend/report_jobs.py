@@ -0,0 +1,176 @@
+import datetime
+import hashlib
+import json
+import tempfile
+import traceback
+
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .models import ReportJob
+from .reports import build_task_report_pdf, task_report_queryset
+from .serializers import TaskSerializer
+from .workers import submit_to_pool
+
+
+def get_report_job_execution():
+    """'pool' (local process pool, the default), 'worker' (process_report_jobs command) or 'inline'."""
+    return getattr(settings, 'REPORT_JOB_EXECUTION', 'pool')
+
+
+def get_report_job_stale_seconds():
+    return getattr(settings, 'REPORT_JOB_STALE_SECONDS', 30 * 60)
+
+
+def get_report_job_max_attempts():
+    return getattr(settings, 'REPORT_JOB_MAX_ATTEMPTS', 3)
+
+
+def normalize_report_filters(ordre_imputation_values=None, start_date=None, end_date=None):
+    """Canonical form of the report filters: equivalent requests map to the same dict."""
+    return {
+        'ordre_imputation_value': sorted(set(ordre_imputation_values or [])),
+        'start_date': start_date.isoformat() if start_date else None,
+        'end_date': end_date.isoformat() if end_date else None,
+    }
+
+
+def filtered_report_queryset(filters):
+    return task_report_queryset(
+        filters['ordre_imputation_value'],
+        datetime.date.fromisoformat(filters['start_date']) if filters['start_date'] else None,
+        datetime.date.fromisoformat(filters['end_date']) if filters['end_date'] else None,
+    )
+
+
+def report_cache_key(output_format, filters):
+    """
+    Hash of the format, the normalized filters and the state of the tasks in
+    scope, read in one aggregate query. Note saves already bump
+    Task.updated_at; the counts catch deleted tasks, notes and images, which
+    leave no timestamp behind.
+    """
+    state = filtered_report_queryset(filters).order_by().aggregate(
+        latest_task=Max('updated_at'),
+        tasks=Count('id', distinct=True),
+        latest_note=Max('advancement_notes__updated_at'),
+        notes=Count('advancement_notes', distinct=True),
+        images=Count('advancement_notes__images', distinct=True),
+    )
+    payload = json.dumps({'format': output_format, 'filters': filters, 'state': state}, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def submit_report_job(user, output_format, filters):
+    """
+    Returns (job, reused). An identical job that is finished, queued or
+    running is reused as is; otherwise a new job is queued and handed to the
+    executor once the transaction commits.
+    """
+    cache_key = report_cache_key(output_format, filters)
+    existing = ReportJob.objects.filter(cache_key=cache_key).exclude(status='failed').order_by('-created_at').first()
+    if existing and (existing.status != 'done' or existing.result.storage.exists(existing.result.name)):
+        return existing, True
+
+    job = ReportJob.objects.create(
+        requested_by=user,
+        output_format=output_format,
+        filters=filters,
+        cache_key=cache_key,
+    )
+    transaction.on_commit(lambda: enqueue_report_job(job.pk))
+    return job, False
+
+
+def enqueue_report_job(job_id):
+    execution = get_report_job_execution()
+    if execution == 'inline':
+        run_report_job(job_id)
+    elif execution == 'pool':
+        submit_to_pool('reports', getattr(settings, 'REPORT_JOB_POOL_SIZE', 2), run_report_job, job_id)
+    # 'worker': the job stays pending until process_report_jobs claims it.
+
+
+def fail_exhausted_report_jobs():
+    """Parks jobs whose worker died too many times (e.g. killed for memory) instead of retrying forever."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=get_report_job_stale_seconds())
+    return ReportJob.objects.filter(
+        status='running', started_at__lt=cutoff, attempts__gte=get_report_job_max_attempts()
+    ).update(status='failed', error="Le traitement du rapport a été interrompu.", finished_at=timezone.now())
+
+
+def claim_report_job(job_id=None):
+    """
+    Marks one pending job (or one whose worker went silent for longer than
+    REPORT_JOB_STALE_SECONDS) as running and returns it, or None. Claimed
+    with SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never share a job.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=get_report_job_stale_seconds())
+    with transaction.atomic():
+        candidates = ReportJob.objects.filter(
+            Q(status='pending') | Q(status='running', started_at__lt=cutoff, attempts__lt=get_report_job_max_attempts())
+        )
+        if job_id is not None:
+            candidates = candidates.filter(pk=job_id)
+        job = candidates.select_for_update(skip_locked=True).order_by('created_at').first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'attempts'])
+    return job
+
+
+def write_report(job, output):
+    queryset = filtered_report_queryset(job.filters)
+    if job.output_format == 'pdf':
+        build_task_report_pdf(
+            queryset,
+            output,
+            job.requested_by.username if job.requested_by else "Système",
+            job.filters['start_date'],
+            job.filters['end_date'],
+            job.filters['ordre_imputation_value'],
+        )
+    else:
+        data = TaskSerializer(queryset, many=True).data
+        output.write(json.dumps(data, cls=DjangoJSONEncoder).encode())
+
+
+def run_report_job(job_id=None):
+    """Claims a job (the given one, or the oldest available), renders it and stores the result."""
+    job = claim_report_job(job_id)
+    if job is None:
+        return None
+    try:
+        with tempfile.TemporaryFile() as spool:
+            write_report(job, spool)
+            spool.seek(0)
+            name = f"rapport_taches_{job.created_at.strftime('%Y%m%d_%H%M%S')}_{job.pk}.{job.output_format}"
+            job.result.save(name, File(spool), save=False)
+        job.status = 'done'
+        job.error = ''
+    except Exception:
+        traceback.print_exc()
+        job.status = 'failed'
+        job.error = traceback.format_exc(limit=5)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['result', 'status', 'error', 'finished_at'])
+    return job
+
+
+def purge_report_jobs(older_than):
+    """Deletes jobs finished before `older_than`, with their result files."""
+    jobs = ReportJob.objects.filter(status__in=['done', 'failed'], finished_at__lt=older_than)
+    purged = 0
+    for job in jobs.iterator():
+        if job.result:
+            job.result.delete(save=False)
+        job.delete()
+        purged += 1
+    return purged
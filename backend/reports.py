@@ -0,0 +1,238 @@
+import io
+import os
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+
+from .images import render_thumbnail
+from .models import Task
+
+REPORT_COL_WIDTHS = [0.7*inch, 1.0*inch, 0.7*inch, 1.8*inch, 0.6*inch, 0.9*inch, 1.0*inch, 0.5*inch, 0.6*inch, 0.6*inch]
+
+
+def get_rows_per_table():
+    return getattr(settings, 'PDF_REPORT_ROWS_PER_TABLE', 200)
+
+
+def task_report_queryset(ordre_imputation_values=None, start_date=None, end_date=None):
+    """Tasks of the admin report: optionally limited to some O.I.s and to those overlapping a date range."""
+    queryset = Task.objects.select_related(
+        'ordre',
+        'assigned_to_profile__user'
+    ).prefetch_related(
+        'techniciens',
+        'advancement_notes__images',
+        'advancement_notes__created_by'
+    ).all().order_by('ordre__value', 'created_at')
+
+    if ordre_imputation_values:
+        queryset = queryset.filter(ordre__value__in=ordre_imputation_values)
+
+    if start_date and end_date:
+        queryset = queryset.filter(
+            (Q(start_date__lte=end_date) | Q(start_date__isnull=True)) &
+            (Q(end_date__gte=start_date) | Q(end_date__isnull=True))
+        )
+    return queryset
+
+
+class LazyStory(list):
+    """
+    A reportlab story that pulls flowables from an iterator as the build
+    consumes them. `doc.build()` re-checks `len(story)` before every flowable,
+    so only a few chunks are alive at any time instead of the whole report.
+    """
+
+    def __init__(self, flowables, lookahead=4):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+
+    def __len__(self):
+        while self._source is not None and super().__len__() < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return super().__len__()
+
+
+class TaskReportTable:
+    """Rows and style commands of one chunk of the task report, built in a single pass."""
+
+    def __init__(self, header_style):
+        self.rows = [[
+            Paragraph("ID Tâche", header_style), Paragraph("O.I.", header_style), Paragraph("Type", header_style),
+            Paragraph("Description Tâche", header_style), Paragraph("Statut", header_style),
+            Paragraph("Chef Parc", header_style), Paragraph("Techniciens", header_style),
+            Paragraph("H Travail", header_style), Paragraph("Début", header_style), Paragraph("Fin", header_style)
+        ]]
+        self.style_commands = [
+            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.black),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('ALIGN', (0,0), (-1,0), 'CENTER'),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0,0), (-1,0), 6),
+            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
+            ('VALIGN', (0,0), (-1,-1), 'TOP'),
+        ]
+
+    def __len__(self):
+        return len(self.rows) - 1
+
+    def add_row(self, row, *style_commands):
+        i = len(self.rows)
+        self.rows.append(row)
+        for command, start, stop, *args in style_commands:
+            self.style_commands.append((command, (start, i), (stop, i), *args))
+
+    def flowable(self):
+        table = Table(self.rows, colWidths=REPORT_COL_WIDTHS, repeatRows=1)
+        table.setStyle(TableStyle(self.style_commands))
+        return table
+
+
+def note_image_flowables(note, small_text_style):
+    image_flowables = []
+    for img_obj in note.images.all():
+        if img_obj.image and hasattr(img_obj.image, 'path'):
+            try:
+                if img_obj.thumbnail and os.path.exists(img_obj.thumbnail.path):
+                    img = Image(img_obj.thumbnail.path, width=0.4*inch, height=0.4*inch)
+                    img.hAlign = 'LEFT'
+                    image_flowables.append(img)
+                elif os.path.exists(img_obj.image.path):
+                    # Not backfilled yet: shrink it here rather than embed a full-size photo.
+                    img = Image(io.BytesIO(render_thumbnail(img_obj.image.path)), width=0.4*inch, height=0.4*inch)
+                    img.hAlign = 'LEFT'
+                    image_flowables.append(img)
+                else:
+                    image_flowables.append(Paragraph("[img absente]", small_text_style))
+            except Exception:
+                image_flowables.append(Paragraph("[err img]", small_text_style))
+        else:
+            image_flowables.append(Paragraph("[ref img invalide]", small_text_style))
+    return image_flowables if image_flowables else Paragraph("Aucune", small_text_style)
+
+
+def add_task_rows(table, task, small_text_style):
+    """Appends one task, and its notes if any, to `table`; a task is never split across tables."""
+    techniciens_str = ", ".join([t.name for t in task.techniciens.all()])
+    table.add_row([
+        Paragraph(task.task_id_display or str(task.id), small_text_style),
+        Paragraph(task.ordre.value if task.ordre else "N/A", small_text_style),
+        Paragraph(task.get_type_display(), small_text_style),
+        Paragraph(task.tasks, small_text_style),
+        Paragraph(task.get_status_display(), small_text_style),
+        Paragraph(task.assigned_to_profile.name if task.assigned_to_profile else "N/A", small_text_style),
+        Paragraph(techniciens_str if techniciens_str else "N/A", small_text_style),
+        Paragraph(str(task.hours_of_work) if task.hours_of_work is not None else "N/A", small_text_style),
+        Paragraph(task.start_date.strftime('%d-%m-%Y') if task.start_date else "N/A", small_text_style),
+        Paragraph(task.end_date.strftime('%d-%m-%Y') if task.end_date else "N/A", small_text_style),
+    ])
+
+    # Sorted in Python: ordering the prefetched notes in SQL would cost a query per task.
+    notes = sorted(task.advancement_notes.all(), key=lambda note: note.date)
+    if not notes:
+        return
+
+    table.add_row(
+        [Paragraph(f"<b>Notes pour Tâche {task.task_id_display or task.id}:</b>", small_text_style)] + [''] * (len(REPORT_COL_WIDTHS) - 1),
+        ('SPAN', 0, -1), ('BACKGROUND', 0, -1, colors.lightblue), ('TEXTCOLOR', 0, -1, colors.black)
+    )
+    table.add_row(
+        [
+            Paragraph("<b>Date</b>", small_text_style),
+            Paragraph("<b>Auteur</b>", small_text_style),
+            Paragraph("<b>Note</b>", small_text_style),
+            '', '', '',
+            Paragraph("<b>Images</b>", small_text_style),
+            '', '', ''
+        ],
+        ('SPAN', 2, 5), ('SPAN', 6, 9), ('BACKGROUND', 0, -1, colors.lightcyan),
+        ('ALIGN', 0, -1, 'CENTER'), ('FONTNAME', 0, -1, 'Helvetica-Bold')
+    )
+    for note in notes:
+        table.add_row(
+            [
+                Paragraph(note.date.strftime('%d-%m-%Y'), small_text_style),
+                Paragraph(note.created_by_username or (note.created_by.username if note.created_by else "Système"), small_text_style),
+                Paragraph(note.note, small_text_style),
+                '', '', '',
+                note_image_flowables(note, small_text_style),
+                '', '', ''
+            ],
+            ('SPAN', 2, 5), ('SPAN', 6, 9), ('BACKGROUND', 0, -1, colors.whitesmoke), ('VALIGN', 6, 6, 'MIDDLE')
+        )
+    table.add_row([''] * len(REPORT_COL_WIDTHS))
+
+
+def task_report_flowables(queryset, styles, rows_per_table, chunk_size=200):
+    """
+    Yields the report body: a heading per O.I. followed by tables of at most
+    `rows_per_table` rows. Tasks are fetched `chunk_size` at a time (with
+    their prefetches), so neither the rows nor the layout grow with the
+    report size.
+    """
+    small_text_style = ParagraphStyle('small_text', parent=styles['Normal'], fontSize=7, leading=9)
+    header_style = ParagraphStyle('header_text', parent=styles['Normal'], fontSize=7, leading=9, fontName='Helvetica-Bold', alignment=1)
+
+    current_ordre = object()
+    table = None
+    for task in queryset.iterator(chunk_size=chunk_size):
+        if task.ordre_id != current_ordre:
+            if table:
+                yield table.flowable()
+                yield Spacer(1, 0.15*inch)
+            current_ordre = task.ordre_id
+            yield Paragraph(f"O.I. {task.ordre.value if task.ordre else 'N/A'}", styles['h3'])
+            table = TaskReportTable(header_style)
+        elif len(table) >= rows_per_table:
+            yield table.flowable()
+            table = TaskReportTable(header_style)
+        add_task_rows(table, task, small_text_style)
+    if table:
+        yield table.flowable()
+
+
+def build_task_report_pdf(queryset, output, generated_by, start_date_str=None, end_date_str=None,
+                          ordre_imputation_value=None, rows_per_table=None):
+    """
+    Renders the task activity report into `output` (a path or a binary file
+    object), one table per O.I. and per `rows_per_table` rows.
+    """
+    doc = SimpleDocTemplate(output, pagesize=landscape(A4), rightMargin=inch/2, leftMargin=inch/2, topMargin=inch/2, bottomMargin=inch/2)
+    styles = getSampleStyleSheet()
+    story = []
+
+    title_text = "Rapport d'Activités des Tâches"
+    filter_criteria = []
+    if ordre_imputation_value and len(ordre_imputation_value) > 0:
+        filter_criteria.append(f"Ordre(s) d'Imputation: {', '.join(ordre_imputation_value)}")
+    if start_date_str and end_date_str:
+        filter_criteria.append(f"Période: {start_date_str} au {end_date_str}")
+
+    if filter_criteria:
+        title_text += " (" + ", ".join(filter_criteria) + ")"
+
+    story.append(Paragraph(title_text, styles['h2']))
+    story.append(Paragraph(f"Généré le: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')} par {generated_by}", styles['Normal']))
+    story.append(Spacer(1, 0.15*inch))
+
+    if not queryset.exists():
+        story.append(Paragraph("Aucune tâche trouvée pour les critères sélectionnés.", styles['Normal']))
+        doc.build(story)
+        return
+
+    def flowables():
+        yield from story
+        yield from task_report_flowables(queryset, styles, rows_per_table or get_rows_per_table())
+
+    doc.build(LazyStory(flowables()))
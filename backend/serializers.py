@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from django.contrib.auth.models import User
 from .models import (
     UserProfile, 
@@ -9,10 +10,20 @@ from .models import (
     Notification, 
     AdvancementNoteImage, 
     PreventiveTaskTemplate,
+    PendingOIHours,
+    ReportJob,
+    ImageUploadSession,
+    allocate_task_ids,
     generate_task_id_display
 )
+from .notifications import NotificationDispatcher
+from .preventive import apply_hour_meter_readings
+from .protected_media import note_image_media_url
+from .uploads import attach_upload_sessions, get_max_upload_size
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
+from django.db.models import Q
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -46,10 +57,12 @@ class OrdreImputationSerializer(serializers.ModelSerializer):
             'date_derniere_visite_effectuee', 
             'dernier_cycle_visite_resultat',
             'total_hours_of_work', # This field can now be written
-            'last_notified_threshold' 
+            'last_notified_threshold',
+            'next_preventive_threshold',
+            'next_preventive_warning_hours'
         ]
         # Removed 'total_hours_of_work' from read_only_fields to allow updates
-        read_only_fields = ('last_notified_threshold',)
+        read_only_fields = ('last_notified_threshold', 'next_preventive_threshold', 'next_preventive_warning_hours')
 
 class PreventiveTaskTemplateSerializer(serializers.ModelSerializer):
     ordre_imputation_value = serializers.CharField(source='ordre_imputation.value', read_only=True)
@@ -88,28 +101,142 @@ class CycleVisiteUpdateSerializer(serializers.Serializer):
         return value
 
 
+class HourMeterReadingSerializer(serializers.Serializer):
+    oi = serializers.CharField(max_length=255, help_text="id_ordre or value of the Ordre d'Imputation.")
+    reading = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    timestamp = serializers.DateTimeField(required=False)
+
+
+class HourMeterBulkSerializer(serializers.Serializer):
+    """
+    Validates a batch of hour-meter readings in one pass: row formats first,
+    then every referenced OI is resolved with a single query.
+    """
+    readings = HourMeterReadingSerializer(many=True, allow_empty=False)
+
+    def validate_readings(self, readings):
+        keys = {row['oi'] for row in readings}
+        ordres = list(OrdreImputation.objects.filter(Q(id_ordre__in=keys) | Q(value__in=keys)))
+        ordres_by_key = {oi.value: oi for oi in ordres}
+        ordres_by_key.update({oi.id_ordre: oi for oi in ordres})  # an id_ordre match wins over a value match
+
+        now = timezone.now()
+        errors = {}
+        for index, row in enumerate(readings):
+            oi = ordres_by_key.get(row['oi'])
+            if oi is None:
+                errors[index] = {'oi': [f"Ordre d'Imputation '{row['oi']}' introuvable."]}
+                continue
+            row['ordre_imputation'] = oi
+            row.setdefault('timestamp', now)
+            if row['timestamp'] > now:
+                errors[index] = {'timestamp': ["Le relevé ne peut pas être dans le futur."]}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return readings
+
+    def create(self, validated_data):
+        return apply_hour_meter_readings(validated_data['readings'])
+
+
+class NoteImageMediaURLField(serializers.Field):
+    """URL of one rendition on the authenticated media endpoint."""
+
+    def __init__(self, rendition, **kwargs):
+        self.rendition = rendition
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, note_image):
+        request = self.context.get('request')
+        url = note_image_media_url(note_image, self.rendition)
+        if url and request:
+            return request.build_absolute_uri(url)
+        return url
+
 class AdvancementNoteImageSerializer(serializers.ModelSerializer):
-    image_url = serializers.ImageField(source='image', read_only=True)
+    image_url = NoteImageMediaURLField('image')
+    medium_url = NoteImageMediaURLField('medium')
+    thumbnail_url = NoteImageMediaURLField('thumbnail')
 
     class Meta:
         model = AdvancementNoteImage
-        fields = ['id', 'image_url', 'uploaded_at']
+        fields = ['id', 'image_url', 'medium_url', 'thumbnail_url', 'processing_status', 'uploaded_at']
+        read_only_fields = ['processing_status']
+
+class ImageUploadSessionSerializer(serializers.ModelSerializer):
+    advancement_note_image = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = ImageUploadSession
+        fields = ['id', 'filename', 'size', 'checksum', 'received', 'status', 'advancement_note_image', 'created_at', 'updated_at']
+        read_only_fields = ['received', 'status', 'advancement_note_image', 'created_at', 'updated_at']
+
+    def validate_filename(self, value):
+        # Only the extension is kept by the content-addressed storage; drop any client path.
+        return value.replace('\\', '/').rsplit('/', 1)[-1] or 'image'
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("La taille doit être positive.")
+        if value > get_max_upload_size():
+            raise serializers.ValidationError(f"La taille maximale est de {get_max_upload_size()} octets.")
+        return value
+
+    def validate_checksum(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdefABCDEF' for c in value)):
+            raise serializers.ValidationError("La somme de contrôle doit être un SHA-256 hexadécimal.")
+        return value.lower()
+
+
+class UploadFinalizeSerializer(serializers.Serializer):
+    advancement_note = serializers.PrimaryKeyRelatedField(
+        queryset=AdvancementNote.objects.select_related('task'), required=False, allow_null=True,
+        help_text="Note to attach the finished upload to; it can also be attached later through `upload_ids`."
+    )
+
+
+class UploadSessionsField(serializers.ListField):
+    """Ids of the current user's complete upload sessions, resolved in one query."""
+    child = serializers.UUIDField()
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        request = self.context.get('request')
+        sessions = ImageUploadSession.objects.filter(pk__in=ids, created_by=request.user, status='complete') if request else []
+        found = {session.pk: session for session in sessions}
+        missing = [str(upload_id) for upload_id in ids if upload_id not in found]
+        if missing:
+            raise serializers.ValidationError(f"Envois introuvables ou non finalisés: {', '.join(missing)}.")
+        return list(found.values())
+
 
 class AdvancementNoteSerializer(serializers.ModelSerializer):
     created_by_username = serializers.ReadOnlyField() 
     task_display_id = serializers.CharField(source='task.task_id_display', read_only=True)
     images = AdvancementNoteImageSerializer(many=True, read_only=True)
+    upload_ids = UploadSessionsField(required=False, write_only=True)
 
     class Meta:
         model = AdvancementNote
-        fields = ['id', 'task', 'task_display_id', 'date', 'note', 'images', 'created_by', 'created_by_username', 'created_at']
+        fields = ['id', 'task', 'task_display_id', 'date', 'note', 'images', 'upload_ids', 'created_by', 'created_by_username', 'created_at']
         read_only_fields = ['created_by', 'created_at', 'created_by_username', 'task_display_id', 'images']
 
     def create(self, validated_data):
+        upload_sessions = validated_data.pop('upload_ids', [])
         request = self.context.get('request')
         if request and hasattr(request, "user") and request.user.is_authenticated:
             validated_data['created_by'] = request.user
-        return super().create(validated_data)
+        advancement_note = super().create(validated_data)
+        attach_upload_sessions(advancement_note, upload_sessions)
+        return advancement_note
+
+    def update(self, instance, validated_data):
+        upload_sessions = validated_data.pop('upload_ids', [])
+        instance = super().update(instance, validated_data)
+        attach_upload_sessions(instance, upload_sessions)
+        return instance
 
 class TaskSerializer(serializers.ModelSerializer):
     advancement_notes = AdvancementNoteSerializer(many=True, read_only=True)
@@ -235,6 +362,251 @@ class TaskSerializer(serializers.ModelSerializer):
             instance.techniciens.set(techniciens_data)
         return instance
 
+class TaskBulkItemSerializer(serializers.ModelSerializer):
+    """
+    One row of a bulk work-order creation. References are plain values here;
+    TaskBulkCreateSerializer resolves them for all rows at once.
+    """
+    ordre_value = serializers.CharField(max_length=255)
+    assigned_to_profile_id = serializers.IntegerField()
+    technicien_ids = serializers.ListField(child=serializers.CharField(max_length=100), required=False, default=list)
+    start_time = serializers.TimeField(required=False, allow_null=True, input_formats=['%H:%M:%S', '%H:%M'])
+
+    class Meta:
+        model = Task
+        fields = [
+            'ordre_value', 'type', 'tasks', 'technicien_ids', 'epi', 'pdr',
+            'assigned_to_profile_id', 'start_date', 'end_date', 'start_time',
+            'estimated_hours', 'hours_of_work'
+        ]
+
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date') and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError({"end_date": "End date cannot be before start date."})
+        return data
+
+
+class TaskBulkCreateSerializer(serializers.Serializer):
+    """
+    Validates every row before anything is written: field formats per row,
+    then OIs, Chefs de Parc and technicians are each resolved with a single
+    query. `create()` inserts the tasks and their technician links with
+    bulk_create, display IDs included.
+    """
+    tasks = TaskBulkItemSerializer(many=True, allow_empty=False)
+
+    def validate_tasks(self, rows):
+        max_rows = getattr(settings, 'TASK_BULK_CREATE_MAX_ROWS', 1000)
+        if len(rows) > max_rows:
+            raise serializers.ValidationError(f"At most {max_rows} tasks can be created at once.")
+
+        ordres = OrdreImputation.objects.in_bulk({row['ordre_value'] for row in rows}, field_name='value')
+        chefs = UserProfile.objects.filter(role='Chef de Parc').in_bulk({row['assigned_to_profile_id'] for row in rows})
+        technician_ids = set(
+            Technician.objects.filter(id_technician__in={tid for row in rows for tid in row['technicien_ids']})
+                              .values_list('id_technician', flat=True)
+        )
+
+        errors = {}
+        for index, row in enumerate(rows):
+            row_errors = {}
+            if row['ordre_value'] not in ordres:
+                row_errors['ordre_value'] = [f"Ordre d'Imputation '{row['ordre_value']}' introuvable."]
+            if row['assigned_to_profile_id'] not in chefs:
+                row_errors['assigned_to_profile_id'] = ["Admin must assign the task to a Chef de Parc."]
+            unknown = [tid for tid in row['technicien_ids'] if tid not in technician_ids]
+            if unknown:
+                row_errors['technicien_ids'] = [f"Unknown technician(s): {', '.join(unknown)}."]
+            if row_errors:
+                errors[index] = row_errors
+                continue
+            row['ordre'] = ordres[row.pop('ordre_value')]
+            row['assigned_to_profile'] = chefs[row.pop('assigned_to_profile_id')]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return rows
+
+    def create(self, validated_data):
+        rows = validated_data['tasks']
+        with transaction.atomic():
+            task_ids = allocate_task_ids(len(rows))
+            if task_ids is None:
+                return self.create_one_by_one(rows)
+            tasks = []
+            links = []
+            for task_id, row in zip(task_ids, rows):
+                technicien_ids = row.pop('technicien_ids')
+                tasks.append(Task(id=task_id, task_id_display=f"ORDT-{task_id}", status='assigned', **row))
+                links.extend(
+                    Task.techniciens.through(task_id=task_id, technician_id=technician_id)
+                    for technician_id in dict.fromkeys(technicien_ids)
+                )
+            Task.objects.bulk_create(tasks, batch_size=500)
+            Task.techniciens.through.objects.bulk_create(links, batch_size=1000)
+            # bulk_create skips post_save: queue the OI hour updates it would have made.
+            for task in tasks:
+                if task.hours_of_work is not None:
+                    PendingOIHours.schedule(task.ordre_id, task.pk)
+        return tasks
+
+    def create_one_by_one(self, rows):
+        # Backends that cannot reserve ids: plain inserts, whose post_save signals set
+        # task_id_display and queue the OI hour updates.
+        tasks = []
+        links = []
+        for row in rows:
+            technicien_ids = row.pop('technicien_ids')
+            task = Task.objects.create(status='assigned', **row)
+            tasks.append(task)
+            links.extend(
+                Task.techniciens.through(task_id=task.pk, technician_id=technician_id)
+                for technician_id in dict.fromkeys(technicien_ids)
+            )
+        Task.techniciens.through.objects.bulk_create(links, batch_size=1000)
+        return tasks
+
+
+class TaskListSerializer(serializers.ModelSerializer):
+    """
+    Compact, read-only task representation used by the task list.
+
+    Only flat columns and note/image counts are returned by default. Heavy
+    nested data is opt-in: `?expand=ordre,technicien_names,advancement_notes`
+    adds it on top of the compact set, while `?fields=a,b,c` picks an exact
+    subset of the available fields.
+    """
+    assignedTo = serializers.CharField(source='assigned_to_profile.name', read_only=True, allow_null=True)
+    ordre_value = serializers.CharField(source='ordre_id', read_only=True, allow_null=True)
+    note_count = serializers.SerializerMethodField()
+    image_count = serializers.SerializerMethodField()
+    ordre = OrdreImputationSerializer(read_only=True)
+    technicien_names = serializers.SerializerMethodField()
+    advancement_notes = AdvancementNoteSerializer(many=True, read_only=True)
+    start_time = serializers.TimeField(read_only=True, format='%H:%M:%S')
+    closed_at = serializers.DateTimeField(read_only=True, format='%Y-%m-%d %H:%M:%S')
+
+    class Meta:
+        model = Task
+        fields = [
+            'id', 'task_id_display', 'ordre_value', 'type', 'tasks', 'status',
+            'assigned_to_profile_id', 'assignedTo',
+            'start_date', 'end_date', 'start_time',
+            'estimated_hours', 'hours_of_work', 'closed_at',
+            'note_count', 'image_count',
+            'created_at', 'updated_at',
+            'ordre', 'technicien_names', 'advancement_notes', 'epi', 'pdr',
+        ]
+        read_only_fields = fields
+        expandable_fields = ['ordre', 'technicien_names', 'advancement_notes', 'epi', 'pdr']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        wanted = self.requested_fields(request)
+        for field_name in list(self.fields):
+            if field_name not in wanted:
+                self.fields.pop(field_name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        all_fields = cls.Meta.fields
+        params = request.query_params if request is not None else {}
+        fields_param = params.get('fields')
+        if fields_param:
+            requested = {f.strip() for f in fields_param.split(',') if f.strip()}
+            return {f for f in all_fields if f in requested}
+        expand_param = params.get('expand', '')
+        expanded = {f.strip() for f in expand_param.split(',') if f.strip()}
+        return {
+            f for f in all_fields
+            if f not in cls.Meta.expandable_fields or f in expanded
+        }
+
+    def get_note_count(self, obj):
+        count = getattr(obj, 'note_count', None)
+        return count if count is not None else obj.advancement_notes.count()
+
+    def get_image_count(self, obj):
+        count = getattr(obj, 'image_count', None)
+        return count if count is not None else AdvancementNoteImage.objects.filter(advancement_note__task=obj).count()
+
+    def get_technicien_names(self, obj):
+        return [technician.name for technician in obj.techniciens.all()]
+
+class TaskListRowSerializer:
+    """
+    Fast read-only path producing exactly the output of TaskListSerializer.
+
+    Rows come from `values()` instead of model instances; technician names
+    are fetched with one query on the M2M table. Each column is formatted
+    with the matching TaskListSerializer field's `to_representation`, so the
+    JSON is identical while per-object DRF overhead is avoided. Requests
+    expanding `advancement_notes` keep using TaskListSerializer.
+    """
+    column_sources = {
+        'ordre_value': 'ordre_id',
+        'assignedTo': 'assigned_to_profile__name',
+    }
+    raw_fields = {'note_count', 'image_count'}
+    # Always selected so pagination and technician lookups can work on the rows.
+    base_columns = ('id', 'created_at', 'updated_at')
+
+    def __init__(self, request):
+        self.fields = TaskListSerializer(context={'request': request}).fields
+        self.ordre_fields = self.fields['ordre'].fields if 'ordre' in self.fields else {}
+
+    @staticmethod
+    def supports(request):
+        return 'advancement_notes' not in TaskListSerializer.requested_fields(request)
+
+    def get_values_queryset(self, queryset):
+        columns = set(self.base_columns)
+        for field_name in self.fields:
+            if field_name == 'ordre':
+                columns.add('ordre_id')
+                columns.update(f'ordre__{name}' for name in self.ordre_fields)
+            elif field_name != 'technicien_names':
+                columns.add(self.column_sources.get(field_name, field_name))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def technicien_names_by_task(self, task_ids):
+        names = {}
+        rows = Task.techniciens.through.objects.filter(task_id__in=task_ids) \
+                                               .order_by('pk') \
+                                               .values_list('task_id', 'technician__name')
+        for task_id, name in rows:
+            names.setdefault(task_id, []).append(name)
+        return names
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        technicien_names = {}
+        if 'technicien_names' in self.fields:
+            technicien_names = self.technicien_names_by_task([row['id'] for row in rows])
+
+        data = []
+        for row in rows:
+            item = {}
+            for field_name, field in self.fields.items():
+                if field_name == 'technicien_names':
+                    item[field_name] = technicien_names.get(row['id'], [])
+                elif field_name == 'ordre':
+                    if row['ordre_id'] is None:
+                        item[field_name] = None
+                    else:
+                        item[field_name] = {
+                            name: None if row[f'ordre__{name}'] is None else ordre_field.to_representation(row[f'ordre__{name}'])
+                            for name, ordre_field in self.ordre_fields.items()
+                        }
+                else:
+                    value = row[self.column_sources.get(field_name, field_name)]
+                    if value is None or field_name in self.raw_fields:
+                        item[field_name] = value
+                    else:
+                        item[field_name] = field.to_representation(value)
+            data.append(item)
+        return data
+
 class NotificationSerializer(serializers.ModelSerializer):
     recipient_user_username = serializers.ReadOnlyField(source='recipient_user.username', allow_null=True)
     task_related_identifier = serializers.SerializerMethodField()
@@ -325,20 +697,16 @@ class PreventiveChecklistSubmissionSerializer(serializers.Serializer):
         task.refresh_from_db()
 
         # Notify Admins that preventive task was submitted
-        admin_profiles = UserProfile.objects.filter(role='Admin')
         submitter_name = current_user_profile.name if current_user_profile else current_user.username
         
-        for admin_profile in admin_profiles:
-            # Avoid notifying the admin if they are the one submitting
-            if admin_profile.user != current_user: 
-                Notification.objects.create(
-                    message=f"Checklist préventive pour OI '{ordre_imputation.value}' soumise par {submitter_name}. Tâche: {task.task_id_display}",
-                    recipient_type='UserInRole',
-                    recipient_role='Admin',
-                    recipient_user=admin_profile.user,
-                    notification_category='TASK', # This notification is about the newly created task
-                    task_related=task # Link to the new task
-                )
+        with NotificationDispatcher.collect() as dispatcher:
+            dispatcher.notify_role(
+                'Admin',
+                message=f"Checklist préventive pour OI '{ordre_imputation.value}' soumise par {submitter_name}. Tâche: {task.task_id_display}",
+                category='TASK', # This notification is about the newly created task
+                task_id=task.id, # Link to the new task
+                exclude_user_ids={current_user.id} # Avoid notifying the admin if they are the one submitting
+            )
         return task
 
 
@@ -446,4 +814,42 @@ class AdminUserUpdateSerializer(serializers.ModelSerializer):
                 role=profile_data.get('role')
             )
             
-        return instance
\ No newline at end of file
+        return instance
+
+
+class ReportJobCreateSerializer(serializers.Serializer):
+    """Same filters as /admin/task-reports/, validated up front so the worker never sees a bad request."""
+    output_format = serializers.ChoiceField(choices=ReportJob.FORMAT_CHOICES, default='pdf')
+    ordre_imputation_value = serializers.ListField(child=serializers.CharField(max_length=255), required=False)
+    start_date = serializers.DateField(required=False, allow_null=True)
+    end_date = serializers.DateField(required=False, allow_null=True)
+
+    def validate(self, data):
+        start_date, end_date = data.get('start_date'), data.get('end_date')
+        if bool(start_date) != bool(end_date):
+            raise serializers.ValidationError("Both start date and end date are required for date range filtering, or neither for no date filter.")
+        if start_date and start_date > end_date:
+            raise serializers.ValidationError("La date de début doit précéder la date de fin.")
+        if data['output_format'] == 'pdf' and not start_date and not data.get('ordre_imputation_value'):
+            raise serializers.ValidationError(
+                "Pour générer un PDF, veuillez sélectionner une plage de dates ou au moins un Ordre d'Imputation spécifique."
+            )
+        return data
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    requested_by_username = serializers.CharField(source='requested_by.username', read_only=True, allow_null=True)
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'output_format', 'filters', 'status', 'error', 'requested_by_username',
+            'created_at', 'started_at', 'finished_at', 'download_url'
+        ]
+        read_only_fields = fields
+
+    def get_download_url(self, obj):
+        if obj.status != 'done':
+            return None
+        return reverse('report-job-download', kwargs={'pk': obj.pk}, request=self.context.get('request'))
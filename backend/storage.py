@@ -0,0 +1,49 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def file_sha256(content):
+    """Hex SHA-256 of a Django File, read in chunks; the file is left rewound."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each file under the SHA-256 of its bytes, e.g.
+    advancement_images/3f/a2/3fa2...e1.jpg. The upload_to directory and the
+    extension come from the requested name; the rest is ignored.
+
+    Identical bytes map to the same name, so saving a file that already
+    exists is a hash check (and an mtime refresh) instead of a write, and
+    several rows can share one file. Files are therefore never deleted when a row stops using them;
+    see images.collect_unreferenced_images().
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        # Callers that already hashed the upload (AdvancementNoteImage.save) leave the digest on it.
+        digest = getattr(content, 'sha256', None) or file_sha256(content)
+        extension = os.path.splitext(name)[1].lower()
+        blob_name = posixpath.join(posixpath.dirname(name), digest[:2], digest[2:4], digest + extension)
+        if self.exists(blob_name):
+            # Refresh the mtime: a blob whose old rows were deleted is now wanted again, and
+            # collect_unreferenced_images() spares recent files until the new row commits.
+            os.utime(self.path(blob_name))
+            return blob_name
+        return self._save(blob_name, content)
+
+
+content_addressed_storage = ContentAddressedStorage()
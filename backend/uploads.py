@@ -0,0 +1,185 @@
+import datetime
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from .models import AdvancementNoteImage, ImageUploadSession
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class UploadConflict(Exception):
+    """A chunk or finalize request that does not match the session's state; `session.received` tells the client where to resume."""
+
+    def __init__(self, message, session):
+        super().__init__(message)
+        self.session = session
+
+
+def get_upload_session_dir():
+    # Deliberately outside MEDIA_ROOT: partial uploads must never be served.
+    return getattr(settings, 'UPLOAD_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'task_trucker_uploads'))
+
+
+def get_max_upload_size():
+    return getattr(settings, 'UPLOAD_SESSION_MAX_BYTES', 50 * 1024 * 1024)
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_MAX_BYTES', 8 * 1024 * 1024)
+
+
+def get_upload_session_expiry():
+    return datetime.timedelta(hours=getattr(settings, 'UPLOAD_SESSION_EXPIRY_HOURS', 24))
+
+
+def upload_part_path(session):
+    return os.path.join(get_upload_session_dir(), f"{session.pk}.part")
+
+
+def parse_content_range(header):
+    """'bytes 0-1048575/5242880' -> (0, 1048575, 5242880); ValueError if malformed."""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise ValueError("Content-Range must look like 'bytes <start>-<end>/<size>'.")
+    start, end, total = (int(group) for group in match.groups())
+    if end < start:
+        raise ValueError("Content-Range end is before its start.")
+    return start, end, total
+
+
+def _check_chunk(session, start, length):
+    if session.status != 'open':
+        raise UploadConflict("Cet envoi est déjà terminé.", session)
+    if start > session.received:
+        raise UploadConflict("Le segment ne suit pas les données déjà reçues.", session)
+    if start + length > session.size:
+        raise UploadConflict("Le segment dépasse la taille annoncée.", session)
+
+
+def write_upload_chunk(session_id, start, length, stream):
+    """
+    Writes `length` bytes read from `stream` at offset `start` of the
+    session's part file and returns the updated session.
+
+    A chunk may start anywhere up to the bytes already received, so a client
+    retrying after a dropped connection may resend an overlap but never has
+    to resend the whole file; a gap raises UploadConflict. Bytes that arrive
+    before the client disconnects are kept.
+
+    The request body is read into a staging file first, with no transaction
+    open: a slow client must not hold a row lock. Only the local copy into
+    the part file and the `received` update happen under the lock.
+    """
+    # Unlocked pre-check, so a chunk that cannot apply is rejected before its body is read.
+    _check_chunk(ImageUploadSession.objects.get(pk=session_id), start, length)
+
+    os.makedirs(get_upload_session_dir(), exist_ok=True)
+    with tempfile.TemporaryFile(dir=get_upload_session_dir()) as staging:
+        written = 0
+        while written < length:
+            block = stream.read(min(COPY_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            staging.write(block)
+            written += len(block)
+        staging.seek(0)
+
+        with transaction.atomic():
+            # The row lock serializes writes to one part file; the state may have moved while reading.
+            session = ImageUploadSession.objects.select_for_update().get(pk=session_id)
+            _check_chunk(session, start, written)
+            path = upload_part_path(session)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+                part.seek(start)
+                shutil.copyfileobj(staging, part, COPY_BLOCK_SIZE)
+            session.received = max(session.received, start + written)
+            session.save(update_fields=['received', 'updated_at'])
+    return session
+
+
+def finalize_upload_session(session_id):
+    """Marks a fully received upload complete after checking its checksum and that it is an image."""
+    with transaction.atomic():
+        session = ImageUploadSession.objects.select_for_update().get(pk=session_id)
+        if session.status != 'open':
+            return session
+        if session.received < session.size:
+            raise UploadConflict("L'envoi est incomplet.", session)
+
+        path = upload_part_path(session)
+        checksum_matches = True
+        if session.checksum:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as part:
+                for block in iter(lambda: part.read(COPY_BLOCK_SIZE), b''):
+                    digest.update(block)
+            checksum_matches = digest.hexdigest() == session.checksum
+        if not checksum_matches:
+            # The bytes cannot be trusted; start over rather than attach a corrupt photo.
+            # Raised after the block below, so the reset is committed rather than rolled back.
+            session.received = 0
+            session.save(update_fields=['received', 'updated_at'])
+            os.remove(path)
+        else:
+            try:
+                # Header check only; the full decode happens in the image pipeline.
+                with Image.open(path):
+                    pass
+            except (OSError, UnidentifiedImageError):
+                raise UploadConflict("Le fichier envoyé n'est pas une image.", session)
+            session.status = 'complete'
+            session.save(update_fields=['status', 'updated_at'])
+    if not checksum_matches:
+        raise UploadConflict("La somme de contrôle ne correspond pas; l'envoi doit être recommencé.", session)
+    return session
+
+
+def attach_upload_sessions(advancement_note, sessions):
+    """
+    Turns complete upload sessions into AdvancementNoteImages of
+    `advancement_note`. The part file goes through the content-addressed
+    storage (so a photo already on disk is not written again) and is removed
+    once the transaction commits.
+    """
+    images = []
+    with transaction.atomic():
+        for session in ImageUploadSession.objects.select_for_update().filter(pk__in=[s.pk for s in sessions], status='complete'):
+            path = upload_part_path(session)
+            with open(path, 'rb') as part:
+                note_image = AdvancementNoteImage.objects.create(
+                    advancement_note=advancement_note,
+                    image=File(part, name=session.filename)
+                )
+            session.status = 'attached'
+            session.advancement_note_image = note_image
+            session.save(update_fields=['status', 'advancement_note_image', 'updated_at'])
+            transaction.on_commit(lambda path=path: os.path.exists(path) and os.remove(path))
+            images.append(note_image)
+    return images
+
+
+def discard_upload_session(session):
+    path = upload_part_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+    session.delete()
+
+
+def purge_expired_upload_sessions(now=None):
+    """Deletes sessions (and part files) untouched for UPLOAD_SESSION_EXPIRY_HOURS; returns how many."""
+    cutoff = (now or timezone.now()) - get_upload_session_expiry()
+    purged = 0
+    for session in ImageUploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+        discard_upload_session(session)
+        purged += 1
+    return purged
@@ -6,12 +6,18 @@ from .views import (
     OrdreImputationViewSet,
     TaskViewSet, 
     AdvancementNoteViewSet, 
+    ImageUploadSessionViewSet,
+    NoteImageMediaView,
+    MediaSessionView,
     NotificationViewSet, 
     CustomAuthToken,
     AdminUserViewSet, 
     AdminTaskReportView,
+    ReportJobViewSet,
     PreventiveTaskTemplateViewSet, # New import
-    PreventiveChecklistSubmissionView # New import
+    PreventiveChecklistSubmissionView, # New import
+    SyncView,
+    BootstrapView
 )
 
 router = DefaultRouter()
@@ -20,14 +26,20 @@ router.register(r'technicians', TechnicianViewSet)
 router.register(r'ordres-imputation', OrdreImputationViewSet, basename='ordreimputation')
 router.register(r'tasks', TaskViewSet)
 router.register(r'advancement-notes', AdvancementNoteViewSet, basename='advancementnote')
+router.register(r'image-uploads', ImageUploadSessionViewSet, basename='image-upload')
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'admin/users', AdminUserViewSet, basename='admin-user')
 router.register(r'admin/preventive-task-templates', PreventiveTaskTemplateViewSet, basename='preventive-task-template') # New route
+router.register(r'admin/report-jobs', ReportJobViewSet, basename='report-job')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('auth-token/', CustomAuthToken.as_view(), name='api_auth_token'),
     path('admin/task-reports/', AdminTaskReportView.as_view(), name='admin_task_reports'),
     path('submit-preventive-checklist/', PreventiveChecklistSubmissionView.as_view(), name='submit_preventive_checklist'), # New path
+    path('note-images/<int:pk>/<str:rendition>/<str:filename>', NoteImageMediaView.as_view(), name='note-image-media'),
+    path('media-session/', MediaSessionView.as_view(), name='media_session'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('bootstrap/', BootstrapView.as_view(), name='bootstrap'),
 ]
 
@@ -1,4 +1,4 @@
-from rest_framework import viewsets, permissions, status, views
+from rest_framework import viewsets, mixins, permissions, status, views
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth.models import User
@@ -11,41 +11,84 @@ from .models import (
     Notification, 
     AdvancementNoteImage, 
     PreventiveTaskTemplate,
+    SyncTombstone,
+    ReportJob,
+    ImageUploadSession,
     generate_task_id_display,
-    check_and_trigger_preventive_tasks
+    check_and_trigger_preventive_tasks,
+    get_ois_approaching_preventive_threshold,
+    get_collection_version,
+    visible_notifications_q,
+    get_unread_notification_count,
+    mark_notifications_read
 )
 from .serializers import (
     UserProfileSerializer, 
     TechnicianSerializer, 
     OrdreImputationSerializer,
     TaskSerializer, 
+    TaskListSerializer,
+    TaskListRowSerializer,
+    TaskBulkCreateSerializer,
     AdvancementNoteSerializer, 
     NotificationSerializer,
     AdminUserListSerializer, 
     AdminUserCreateSerializer, 
     AdminUserUpdateSerializer,
     CycleVisiteUpdateSerializer,
+    HourMeterBulkSerializer,
     PreventiveTaskTemplateSerializer, 
-    PreventiveChecklistSubmissionSerializer
+    PreventiveChecklistSubmissionSerializer,
+    ReportJobCreateSerializer,
+    ReportJobSerializer,
+    ImageUploadSessionSerializer,
+    UploadFinalizeSerializer
 )
 from rest_framework import serializers as drf_serializers_module 
 from rest_framework import exceptions as drf_exceptions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated, OR # Ensure OR is imported
+from rest_framework import filters as drf_filters
+from .pagination import TaskCursorPagination, NotificationCursorPagination
+from .filters import TaskFilterBackend
+from .notifications import NotificationDispatcher
+from .forecasting import forecast_preventive_thresholds, DEFAULT_LOOKBACK_DAYS, REPORT_ORDERING_FIELDS
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.db.models import Q, Count, Max
 from django.db import transaction
 import traceback 
-
-from django.http import HttpResponse
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.units import inch
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
+from .reports import build_task_report_pdf, task_report_queryset
+from .report_jobs import normalize_report_filters, submit_report_job
+from .protected_media import (
+    RENDITION_FIELDS,
+    MediaSessionAuthentication,
+    delete_media_session_cookie,
+    get_access_token_max_age,
+    protected_file_response,
+    set_media_session_cookie,
+)
+from .uploads import (
+    UploadConflict,
+    attach_upload_sessions,
+    discard_upload_session,
+    finalize_upload_session,
+    get_max_chunk_size,
+    parse_content_range,
+    write_upload_chunk,
+)
 import io
-import os
+import tempfile
+import csv
+import hashlib
 
 # --- Custom Renderer for PDF (to help DRF content negotiation) ---
 from rest_framework.renderers import BaseRenderer, JSONRenderer
@@ -61,39 +104,43 @@ class PassthroughPDFRenderer(BaseRenderer):
              return b'' 
         return b"Error: PDF content was not a direct HttpResponse."
 
+class CSVRenderer(BaseRenderer):
+    """Renders a list of flat dicts (or an error dict) as CSV with a header row."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = [{'field': key, 'error': value} for key, value in data.items()]
+        output = io.StringIO()
+        if data:
+            writer = csv.DictWriter(output, fieldnames=list(data[0].keys()))
+            writer.writeheader()
+            writer.writerows(data)
+        return output.getvalue().encode(self.charset)
+
+
+# --- Custom Parser for CSV uploads (bulk hour-meter readings) ---
+from rest_framework.parsers import BaseParser, JSONParser, MultiPartParser
+
+def read_csv_rows(stream, encoding='utf-8-sig'):
+    # Empty cells are left out so that optional columns fall back to their defaults.
+    return [
+        {key: value for key, value in row.items() if value not in ('', None)}
+        for row in csv.DictReader(io.StringIO(stream.read().decode(encoding)))
+    ]
+
+class CSVTextParser(BaseParser):
+    """Parses a `text/csv` body (with a header row) into a list of dicts."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return read_csv_rows(stream)
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise drf_exceptions.ParseError(f"CSV parse error - {e}")
 
-# --- Helper function to create notifications ---
-def create_notification(message, recipient_type, recipient_role, notification_category, 
-                        recipient_user_id=None, task_id=None, ordre_imputation_id=None):
-    try:
-        notif_data = {
-            'message': message,
-            'recipient_type': recipient_type,
-            'recipient_role': recipient_role,
-            'notification_category': notification_category,
-        }
-        
-        if recipient_user_id:
-            user_instance = User.objects.get(id=recipient_user_id)
-            notif_data['recipient_user'] = user_instance
-        
-        if task_id:
-            task_instance = Task.objects.get(id=task_id)
-            notif_data['task_related'] = task_instance
-        
-        if ordre_imputation_id:
-            oi_instance = OrdreImputation.objects.get(id_ordre=ordre_imputation_id)
-            notif_data['ordre_imputation_related'] = oi_instance
-            
-        Notification.objects.create(**notif_data)
-    except User.DoesNotExist:
-        print(f"Error creating notification: User with ID {recipient_user_id} does not exist.")
-    except Task.DoesNotExist:
-        print(f"Error creating notification: Task with ID {task_id} does not exist.")
-    except OrdreImputation.DoesNotExist:
-        print(f"Error creating notification: OrdreImputation with ID {ordre_imputation_id} does not exist.")
-    except Exception as e:
-        print(f"Error creating notification: {e}")
 
 # --- Custom Permissions ---
 class IsAdminUser(permissions.BasePermission):
@@ -126,6 +173,75 @@ class IsOwnerOrAdminForAdvancementNote(permissions.BasePermission):
             return obj.task and obj.task.assigned_to_profile == request.user.profile
         return False
 
+# --- Shared querysets ---
+def get_task_list_queryset(request):
+    """Unscoped task queryset for TaskListSerializer, joining only what the request renders."""
+    wanted = TaskListSerializer.requested_fields(request)
+    qs = Task.objects.select_related('assigned_to_profile')
+    if 'ordre' in wanted:
+        qs = qs.select_related('ordre')
+    if 'technicien_names' in wanted:
+        qs = qs.prefetch_related('techniciens')
+    if 'advancement_notes' in wanted:
+        qs = qs.prefetch_related('advancement_notes__images')
+    if 'note_count' in wanted:
+        qs = qs.annotate(note_count=Count('advancement_notes', distinct=True))
+    if 'image_count' in wanted:
+        qs = qs.annotate(image_count=Count('advancement_notes__images', distinct=True))
+    return qs
+
+def serialize_task_list(queryset, request):
+    """Compact task list data, through the values() fast path whenever the requested fields allow it."""
+    if TaskListRowSerializer.supports(request):
+        row_serializer = TaskListRowSerializer(request)
+        return row_serializer.to_representation(row_serializer.get_values_queryset(queryset))
+    return TaskListSerializer(queryset, many=True, context={'request': request}).data
+
+def get_notification_queryset(user):
+    # Both predicates hit the same table without joins, so no DISTINCT is needed.
+    return Notification.objects.filter(visible_notifications_q(user, user.profile.role))\
+                             .select_related('recipient_user', 'task_related', 'ordre_imputation_related')\
+                             .order_by('-timestamp', '-id')
+
+# --- Conditional GET for reference data ---
+class CollectionETagMixin:
+    """
+    Strong ETags for list/retrieve on slowly changing reference collections.
+
+    The ETag is derived from the collection's CollectionVersion counter (bumped
+    by save/delete signals) and the request path, so an `If-None-Match` hit is
+    answered with 304 after a single-row lookup, before the queryset or the
+    serializer run. Collections whose fields the serializer embeds go in
+    `etag_related_collections`, so their changes invalidate the ETag too.
+    """
+    etag_collection = None
+    etag_related_collections = ()
+
+    def get_collection_etag(self, request):
+        version = "-".join(
+            str(get_collection_version(name)) for name in (self.etag_collection, *self.etag_related_collections)
+        )
+        path_hash = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()[:8]
+        return f'"{self.etag_collection}-{version}-{path_hash}"'
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        etag = self.get_collection_etag(request)
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
 # --- ViewSets ---
 class UserProfileViewSet(viewsets.ModelViewSet):
     queryset = UserProfile.objects.all().select_related('user')
@@ -150,17 +266,19 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(profiles, many=True)
         return Response(serializer.data)
 
-class TechnicianViewSet(viewsets.ModelViewSet):
+class TechnicianViewSet(CollectionETagMixin, viewsets.ModelViewSet):
     queryset = Technician.objects.all()
     serializer_class = TechnicianSerializer 
+    etag_collection = 'technicians'
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
-class OrdreImputationViewSet(viewsets.ModelViewSet):
+class OrdreImputationViewSet(CollectionETagMixin, viewsets.ModelViewSet):
     queryset = OrdreImputation.objects.all()
     serializer_class = OrdreImputationSerializer 
+    etag_collection = 'ordres_imputation'
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'destroy']:
@@ -169,8 +287,101 @@ class OrdreImputationViewSet(viewsets.ModelViewSet):
             return [OR(IsAdminUser(), IsChefDeParcUser())]
         if self.action == 'update_cycle_visite': 
             return [IsChefDeParcUser()]
+        if self.action == 'bulk_hours':
+            return [OR(IsAdminUser(), IsChefDeParcUser())]
         return [IsAuthenticated()]
 
+    @action(detail=False, methods=['get'], url_path='preventive-forecast', renderer_classes=[JSONRenderer, CSVRenderer])
+    def preventive_forecast(self, request):
+        """
+        Fleet-wide preventive workload report: hours remaining to each OI's
+        next threshold, % of the interval consumed, checklist size and the
+        projected due date from the hour-meter usage of the last
+        `?lookback_days=` (default 90) days.
+
+        Filters: oi (comma separated id_ordre), search (OI value),
+        max_hours_remaining, min_percent_consumed, due_within_days,
+        scheduled_only. Sort with `?ordering=` (prefix '-' for descending).
+        `?format=csv` returns the same rows as a CSV download.
+        """
+        params = request.query_params
+        errors = {}
+
+        def number(name, cast=float, minimum=None, maximum=None):
+            if params.get(name) in (None, ''):
+                return None
+            try:
+                value = cast(params[name])
+            except ValueError:
+                errors[name] = "Must be a number."
+                return None
+            if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+                errors[name] = f"Must be between {minimum} and {maximum}."
+            return value
+
+        lookback_days = number('lookback_days', int, 1, 3650) or DEFAULT_LOOKBACK_DAYS
+        ordering = params.get('ordering', 'hours_remaining')
+        if ordering.lstrip('-') not in REPORT_ORDERING_FIELDS:
+            errors['ordering'] = "Must be one of: " + ", ".join(REPORT_ORDERING_FIELDS) + "."
+        filters = {
+            'max_hours_remaining': number('max_hours_remaining'),
+            'min_percent_consumed': number('min_percent_consumed'),
+            'due_within_days': number('due_within_days', int, 0, 3650),
+            'scheduled_only': params.get('scheduled_only', '').lower() in ('1', 'true', 'yes'),
+        }
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        ordres = OrdreImputation.objects.order_by('value')
+        if params.get('oi'):
+            ordres = ordres.filter(id_ordre__in=TaskFilterBackend.split_values(params['oi']))
+        if params.get('search'):
+            ordres = ordres.filter(value__icontains=params['search'])
+
+        rows = forecast_preventive_thresholds(ordres, lookback_days=lookback_days, ordering=ordering, **filters)
+        response = Response(rows)
+        if request.accepted_renderer.format == 'csv':
+            response['Content-Disposition'] = f'attachment; filename="preventive_forecast_{timezone.localdate():%Y%m%d}.csv"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='bulk-hours', parser_classes=[JSONParser, CSVTextParser, MultiPartParser])
+    def bulk_hours(self, request):
+        """
+        Ingests hour-meter readings for many OIs at once. Accepts a JSON list
+        (or {"readings": [...]}) of {oi, reading, timestamp} rows, a text/csv
+        body with those columns, or a multipart upload of that CSV as `file`.
+        Nothing is applied unless every row is valid.
+        """
+        if 'file' in request.FILES:
+            try:
+                rows = read_csv_rows(request.FILES['file'])
+            except (UnicodeDecodeError, csv.Error) as e:
+                return Response({"file": f"CSV parse error - {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, dict):
+            rows = request.data.get('readings')
+        else:
+            # A list, or a JSON scalar the serializer rejects with a 400.
+            rows = request.data
+
+        serializer = HourMeterBulkSerializer(data={'readings': rows})
+        if serializer.is_valid():
+            summary = serializer.save()
+            return Response(summary, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'], url_path='approaching-preventive')
+    def approaching_preventive(self, request):
+        """
+        OIs within `?within=` hours (default 0: already past) of their next
+        preventive warning point, closest first.
+        """
+        try:
+            within_hours = Decimal(request.query_params.get('within', '0'))
+        except InvalidOperation:
+            return Response({"within": "Must be a number of hours."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = get_ois_approaching_preventive_threshold(within_hours).order_by('hours_to_warning', 'value')
+        return Response(self.get_serializer(queryset, many=True).data)
+
     def partial_update(self, request, *args, **kwargs):
         if hasattr(request.user, 'profile') and request.user.profile.role == 'Chef de Parc':
             allowed_fields = {'total_hours_of_work'}
@@ -199,100 +410,170 @@ class OrdreImputationViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             validated_data = serializer.validated_data
             
-            ordre_imputation.dernier_cycle_visite_resultat = validated_data['visite_acceptee']
-            ordre_imputation.date_prochain_cycle_visite = validated_data['date_prochaine_visite']
-            ordre_imputation.date_derniere_visite_effectuee = validated_data['date_visite_effectuee']
-            ordre_imputation.save()
-
-            admin_profiles = UserProfile.objects.filter(role='Admin')
-            result_text = "acceptée" if validated_data['visite_acceptee'] else "échouée"
-            for admin_profile in admin_profiles:
-                if admin_profile.user:
-                    create_notification(
-                        message=f"La visite de cycle pour l'OI '{ordre_imputation.value}' a été enregistrée comme {result_text} par {request.user.profile.name}. Prochaine visite le {validated_data['date_prochaine_visite']}.",
-                        recipient_type='UserInRole',
-                        recipient_role='Admin',
-                        recipient_user_id=admin_profile.user.id,
-                        notification_category='CYCLE_VISIT',
-                        ordre_imputation_id=ordre_imputation.id_ordre
-                    )
+            with transaction.atomic(), NotificationDispatcher.collect() as dispatcher:
+                ordre_imputation.dernier_cycle_visite_resultat = validated_data['visite_acceptee']
+                ordre_imputation.date_prochain_cycle_visite = validated_data['date_prochaine_visite']
+                ordre_imputation.date_derniere_visite_effectuee = validated_data['date_visite_effectuee']
+                ordre_imputation.save()
+
+                result_text = "acceptée" if validated_data['visite_acceptee'] else "échouée"
+                dispatcher.notify_role(
+                    'Admin',
+                    message=f"La visite de cycle pour l'OI '{ordre_imputation.value}' a été enregistrée comme {result_text} par {request.user.profile.name}. Prochaine visite le {validated_data['date_prochaine_visite']}.",
+                    category='CYCLE_VISIT',
+                    ordre_imputation_id=ordre_imputation.id_ordre
+                )
             
             return Response(OrdreImputationSerializer(ordre_imputation).data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class PreventiveTaskTemplateViewSet(viewsets.ModelViewSet):
+class PreventiveTaskTemplateViewSet(CollectionETagMixin, viewsets.ModelViewSet):
     queryset = PreventiveTaskTemplate.objects.select_related('ordre_imputation').all().order_by('ordre_imputation__value', 'trigger_hours')
     serializer_class = PreventiveTaskTemplateSerializer
+    etag_collection = 'preventive_task_templates'
+    # The serializer embeds ordre_imputation.value, so an OI rename must change the ETag.
+    etag_related_collections = ('ordres_imputation',)
     permission_classes = [IsAdminUser]
 
 class TaskViewSet(viewsets.ModelViewSet):
-    queryset = Task.objects.all().order_by('-created_at')
+    queryset = Task.objects.all().order_by('-created_at', 'id')
     serializer_class = TaskSerializer 
+    pagination_class = TaskCursorPagination
+    filter_backends = [TaskFilterBackend, drf_filters.SearchFilter, drf_filters.OrderingFilter]
+    search_fields = ['tasks', 'task_id_display']
+    ordering_fields = ['created_at', 'updated_at', 'start_date', 'end_date', 'closed_at', 'status', 'id']
+    ordering = ['-created_at', 'id']
 
     def get_permissions(self):
         if self.action == 'create':
             return [IsAuthenticated(), OR(IsAdminUser(), IsChefDeParcUser())] 
+        if self.action == 'bulk_create':
+            return [IsAdminUser()]
         if self.action in ['update', 'partial_update', 'destroy']:
             return [IsAuthenticated(), IsOwnerOrAdminForTask()]
         return [IsAuthenticated()]
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return TaskListSerializer
+        return TaskSerializer
+
     def get_queryset(self):
         user = self.request.user
         if not user.is_authenticated or not hasattr(user, 'profile'):
             return Task.objects.none() 
 
-        qs = Task.objects.select_related('ordre', 'assigned_to_profile__user') \
-                         .prefetch_related('techniciens', 'advancement_notes__images', 'task_notifications') 
+        if self.action == 'list':
+            qs = get_task_list_queryset(self.request)
+        else:
+            qs = Task.objects.select_related('ordre', 'assigned_to_profile__user') \
+                             .prefetch_related('techniciens', 'advancement_notes__images')
         
         if user.profile.role == 'Admin':
-            return qs.all().order_by('-created_at')
+            return qs.all().order_by('-created_at', 'id')
         elif user.profile.role == 'Chef de Parc':
-            return qs.filter(assigned_to_profile=user.profile).order_by('-created_at')
+            return qs.filter(assigned_to_profile=user.profile).order_by('-created_at', 'id')
         
         return Task.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        if not TaskListRowSerializer.supports(request):
+            return super().list(request, *args, **kwargs)
+
+        row_serializer = TaskListRowSerializer(request)
+        rows = row_serializer.get_values_queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(row_serializer.to_representation(page))
+        return Response(row_serializer.to_representation(rows))
+
+    @transaction.atomic
     def perform_create(self, serializer):
         current_user_profile = self.request.user.profile
         task_status = 'assigned' 
         
-        if current_user_profile.role == 'Admin':
-            if not serializer.validated_data.get('assigned_to_profile'):
-                 raise drf_exceptions.ValidationError({"assigned_to_profile_id": "Admin must assign the task to a Chef de Parc."})
-            task_status = 'assigned'
-            task = serializer.save(status=task_status)
-            task_identifier = task.task_id_display or task.id
-            if task.assigned_to_profile and task.assigned_to_profile.user:
-                create_notification(
-                    message=f"Nouveau OT '{task_identifier}' vous a été assigné par l'Admin.",
-                    recipient_type='UserInRole',
-                    recipient_role='Chef de Parc',
-                    recipient_user_id=task.assigned_to_profile.user.id,
-                    task_id=task.id,
-                    notification_category='TASK'
-                )
-        elif current_user_profile.role == 'Chef de Parc':
-            task_status = 'in progress' 
-            task = serializer.save(assigned_to_profile=current_user_profile, status=task_status)
-            task_identifier = task.task_id_display or task.id
-            admin_profiles = UserProfile.objects.filter(role='Admin')
-            for admin_profile in admin_profiles:
-                if admin_profile.user:
-                    create_notification(
-                        message=f"Nouveau OT '{task_identifier}' créé par {current_user_profile.name} est maintenant '{task.get_status_display()}'.",
-                        recipient_type='UserInRole', 
-                        recipient_role='Admin',
-                        recipient_user_id=admin_profile.user.id, 
-                        task_id=task.id,
-                        notification_category='TASK'
+        with NotificationDispatcher.collect() as dispatcher:
+            if current_user_profile.role == 'Admin':
+                if not serializer.validated_data.get('assigned_to_profile'):
+                     raise drf_exceptions.ValidationError({"assigned_to_profile_id": "Admin must assign the task to a Chef de Parc."})
+                task_status = 'assigned'
+                task = serializer.save(status=task_status)
+                task_identifier = task.task_id_display or task.id
+                if task.assigned_to_profile:
+                    dispatcher.notify_user(
+                        task.assigned_to_profile.user_id, 'Chef de Parc',
+                        message=f"Nouveau OT '{task_identifier}' vous a été assigné par l'Admin.",
+                        category='TASK',
+                        task_id=task.id
                     )
-        else:
-            raise permissions.PermissionDenied("Vous n'avez pas la permission de créer des ordres de travail.")
+            elif current_user_profile.role == 'Chef de Parc':
+                task_status = 'in progress' 
+                task = serializer.save(assigned_to_profile=current_user_profile, status=task_status)
+                task_identifier = task.task_id_display or task.id
+                dispatcher.notify_role(
+                    'Admin',
+                    message=f"Nouveau OT '{task_identifier}' créé par {current_user_profile.name} est maintenant '{task.get_status_display()}'.",
+                    category='TASK',
+                    task_id=task.id
+                )
+            else:
+                raise permissions.PermissionDenied("Vous n'avez pas la permission de créer des ordres de travail.")
         
         if task and not task.task_id_display: 
             generate_task_id_display(task)
             task.refresh_from_db()
 
 
+    @action(detail=False, methods=['post'], url_path='bulk-create')
+    def bulk_create(self, request):
+        """
+        Creates many work orders at once (e.g. planning a shutdown). Every row
+        is validated before anything is written; each Chef de Parc then gets a
+        single digest notification listing the orders assigned to them.
+        """
+        if isinstance(request.data, list):
+            rows = request.data
+        elif isinstance(request.data, dict):
+            rows = request.data.get('tasks')
+        else:
+            return Response(
+                {'tasks': ["Expected a list of tasks or an object with a `tasks` list."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = TaskBulkCreateSerializer(data={'tasks': rows}, context={'request': request})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic(), NotificationDispatcher.collect() as dispatcher:
+            tasks = serializer.save()
+            tasks_by_chef = {}
+            for task in tasks:
+                tasks_by_chef.setdefault(task.assigned_to_profile, []).append(task)
+            for chef_profile, chef_tasks in tasks_by_chef.items():
+                listed = ", ".join(task.task_id_display for task in chef_tasks[:20])
+                if len(chef_tasks) > 20:
+                    listed += f" (et {len(chef_tasks) - 20} autres)"
+                dispatcher.notify_user(
+                    chef_profile.user_id, 'Chef de Parc',
+                    message=f"{len(chef_tasks)} nouveau(x) OT vous ont été assignés par l'Admin: {listed}.",
+                    category='TASK',
+                    task_id=chef_tasks[0].pk if len(chef_tasks) == 1 else None
+                )
+
+        return Response({
+            'created': len(tasks),
+            'tasks': [
+                {
+                    'id': task.pk,
+                    'task_id_display': task.task_id_display,
+                    'ordre_value': task.ordre_id,
+                    'assigned_to_profile_id': task.assigned_to_profile_id,
+                }
+                for task in tasks
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+    @transaction.atomic
     def perform_update(self, serializer):
         instance = serializer.instance
         original_status = instance.status
@@ -319,42 +600,38 @@ class TaskViewSet(viewsets.ModelViewSet):
                     updated_status = 'closed'
                     status_changed = True
         
-        # Save other field updates first
-        instance = serializer.save()
-
-        # If status has changed, update status and closed_at field
-        if status_changed:
-            instance.status = updated_status
-            if updated_status == 'closed' and original_status != 'closed':
-                instance.closed_at = timezone.now()
-            elif original_status == 'closed' and updated_status != 'closed':
-                instance.closed_at = None
-            instance.save(update_fields=['status', 'closed_at', 'updated_at'])
-
-            # Notification Logic
-            task_identifier = instance.task_id_display or instance.id
-            message = ""
-            if current_user_profile.role == 'Chef de Parc':
-                if updated_status == 'in progress':
-                    message = f"L'OT '{task_identifier}' assigné à {current_user_profile.name} est maintenant '{instance.get_status_display()}'."
-                elif updated_status == 'closed':
-                    message = f"L'OT '{task_identifier}' a été clôturé par {current_user_profile.name}."
-                
-                if message:
-                    admin_profiles = UserProfile.objects.filter(role='Admin')
-                    for admin_profile in admin_profiles:
-                        if admin_profile.user:
-                            create_notification(message=message, recipient_type='UserInRole', recipient_role='Admin',
-                                                recipient_user_id=admin_profile.user.id, task_id=instance.id,
-                                                notification_category='TASK')
-            elif current_user_profile.role == 'Admin':
-                if instance.assigned_to_profile and instance.assigned_to_profile.user:
-                    create_notification(
-                        message=f"Le statut de l'OT '{task_identifier}' a été changé à '{instance.get_status_display()}' par l'Admin.",
-                        recipient_type='UserInRole', recipient_role='Chef de Parc',
-                        recipient_user_id=instance.assigned_to_profile.user.id, task_id=instance.id,
-                        notification_category='TASK'
-                    )
+        with NotificationDispatcher.collect() as dispatcher:
+            # Save other field updates first
+            instance = serializer.save()
+
+            # If status has changed, update status and closed_at field
+            if status_changed:
+                instance.status = updated_status
+                if updated_status == 'closed' and original_status != 'closed':
+                    instance.closed_at = timezone.now()
+                elif original_status == 'closed' and updated_status != 'closed':
+                    instance.closed_at = None
+                instance.save(update_fields=['status', 'closed_at', 'updated_at'])
+
+                # Notification Logic
+                task_identifier = instance.task_id_display or instance.id
+                message = ""
+                if current_user_profile.role == 'Chef de Parc':
+                    if updated_status == 'in progress':
+                        message = f"L'OT '{task_identifier}' assigné à {current_user_profile.name} est maintenant '{instance.get_status_display()}'."
+                    elif updated_status == 'closed':
+                        message = f"L'OT '{task_identifier}' a été clôturé par {current_user_profile.name}."
+                    
+                    if message:
+                        dispatcher.notify_role('Admin', message=message, category='TASK', task_id=instance.id)
+                elif current_user_profile.role == 'Admin':
+                    if instance.assigned_to_profile:
+                        dispatcher.notify_user(
+                            instance.assigned_to_profile.user_id, 'Chef de Parc',
+                            message=f"Le statut de l'OT '{task_identifier}' a été changé à '{instance.get_status_display()}' par l'Admin.",
+                            category='TASK',
+                            task_id=instance.id
+                        )
 
 class AdvancementNoteViewSet(viewsets.ModelViewSet):
     queryset = AdvancementNote.objects.all().order_by('-created_at')
@@ -398,43 +675,147 @@ class AdvancementNoteViewSet(viewsets.ModelViewSet):
             AdvancementNoteImage.objects.create(advancement_note=advancement_note, image=image_file)
             
         task_identifier = task_instance.task_id_display or task_instance.id
-        if user_profile.role == 'Chef de Parc': 
-            admin_profiles = UserProfile.objects.filter(role='Admin')
-            for admin_profile in admin_profiles:
-                 if admin_profile.user:
-                    create_notification(
-                        message=f"Nouvelle note ajoutée à l'OT '{task_identifier}' par {user_profile.name}.",
-                        recipient_type='UserInRole',
-                        recipient_role='Admin',
-                        recipient_user_id=admin_profile.user.id,
-                        task_id=task_instance.id,
-                        notification_category='TASK'
-                    )
-        elif user_profile.role == 'Admin' and task_instance.assigned_to_profile and task_instance.assigned_to_profile.user:
-            create_notification(
-                message=f"Nouvelle note ajoutée à votre OT '{task_identifier}' par l'Admin.",
-                recipient_type='UserInRole',
-                recipient_role='Chef de Parc',
-                recipient_user_id=task_instance.assigned_to_profile.user.id,
-                task_id=task_instance.id,
-                notification_category='TASK'
+        with NotificationDispatcher.collect() as dispatcher:
+            if user_profile.role == 'Chef de Parc': 
+                dispatcher.notify_role(
+                    'Admin',
+                    message=f"Nouvelle note ajoutée à l'OT '{task_identifier}' par {user_profile.name}.",
+                    category='TASK',
+                    task_id=task_instance.id
+                )
+            elif user_profile.role == 'Admin' and task_instance.assigned_to_profile:
+                dispatcher.notify_user(
+                    task_instance.assigned_to_profile.user_id, 'Chef de Parc',
+                    message=f"Nouvelle note ajoutée à votre OT '{task_identifier}' par l'Admin.",
+                    category='TASK',
+                    task_id=task_instance.id
+                )
+
+class ImageUploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Resumable note image uploads:
+      POST   /image-uploads/                     {filename, size, checksum?} -> session
+      PUT    /image-uploads/<id>/                raw bytes, Content-Range: bytes <start>-<end>/<size>
+      GET    /image-uploads/<id>/                progress (`received` is where to resume)
+      POST   /image-uploads/<id>/finalize/       {advancement_note?}
+      DELETE /image-uploads/<id>/                abort
+    A finalized upload is attached to a note here or through the note's `upload_ids`.
+    """
+    serializer_class = ImageUploadSessionSerializer
+
+    def get_permissions(self):
+        return [IsAuthenticated(), OR(IsAdminUser(), IsChefDeParcUser())]
+
+    def get_queryset(self):
+        return ImageUploadSession.objects.filter(created_by=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    def perform_destroy(self, instance):
+        discard_upload_session(instance)
+
+    def conflict_response(self, error):
+        data = self.get_serializer(error.session).data
+        data['error'] = str(error)
+        return Response(data, status=status.HTTP_409_CONFLICT)
+
+    def update(self, request, pk=None):
+        session = self.get_object()
+        try:
+            start, end, total = parse_content_range(request.headers.get('Content-Range'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        length = end - start + 1
+        if total != session.size:
+            return Response({'error': f"La taille totale doit être {session.size}."}, status=status.HTTP_400_BAD_REQUEST)
+        if length > get_max_chunk_size():
+            return Response(
+                {'error': f"Un segment ne peut dépasser {get_max_chunk_size()} octets."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
             )
+        if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+            return Response({'error': "Content-Length ne correspond pas à Content-Range."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            session = write_upload_chunk(session.pk, start, length, request.stream)
+        except UploadConflict as e:
+            return self.conflict_response(e)
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        serializer = UploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        advancement_note = serializer.validated_data.get('advancement_note')
+        if advancement_note and not IsOwnerOrAdminForAdvancementNote().has_object_permission(request, self, advancement_note):
+            raise drf_exceptions.PermissionDenied("You can only add images to notes of tasks assigned to you.")
+
+        try:
+            session = finalize_upload_session(session.pk)
+        except UploadConflict as e:
+            return self.conflict_response(e)
+        if advancement_note and session.status == 'complete':
+            attach_upload_sessions(advancement_note, [session])
+            session.refresh_from_db()
+        return Response(self.get_serializer(session).data)
+
+class NoteImageMediaView(views.APIView):
+    """
+    GET /note-images/<id>/<image|medium|thumbnail>/<stored file name>
+    Serves a note image to the users who may see its note; the URLs come from
+    the `*_url` fields of AdvancementNoteImageSerializer.
+    """
+    authentication_classes = [*views.APIView.authentication_classes, MediaSessionAuthentication]
+
+    def get_permissions(self):
+        return [IsAuthenticated(), IsOwnerOrAdminForAdvancementNote()]
+
+    def get(self, request, pk, rendition, filename):
+        if rendition not in RENDITION_FIELDS:
+            raise Http404
+        note_image = get_object_or_404(
+            AdvancementNoteImage.objects.select_related('advancement_note__task__assigned_to_profile'), pk=pk
+        )
+        self.check_object_permissions(request, note_image.advancement_note)
+        field_file = getattr(note_image, rendition)
+        # A stale name means the image was reprocessed since the URL was issued.
+        if not field_file or field_file.name.rsplit('/', 1)[-1] != filename:
+            raise Http404
+        try:
+            return protected_file_response(request, field_file)
+        except FileNotFoundError:
+            raise Http404
+
+class MediaSessionView(views.APIView):
+    """
+    POST sets (or renews) the cookie that lets <img> tags load note images
+    from NoteImageMediaView; clients renew it before `expires_in` runs out.
+    DELETE clears it on logout.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        return set_media_session_cookie(Response({'expires_in': get_access_token_max_age()}), request.user)
+
+    def delete(self, request, *args, **kwargs):
+        return delete_media_session_cookie(Response(status=status.HTTP_204_NO_CONTENT))
 
 class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated] 
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         if not user.is_authenticated or not hasattr(user, 'profile'):
             return Notification.objects.none()
         
-        q_role_general = Q(recipient_type='Role', recipient_role=user.profile.role)
-        q_user_specific = Q(recipient_type='UserInRole', recipient_user=user, recipient_role=user.profile.role)
-        
-        return Notification.objects.filter(q_role_general | q_user_specific)\
-                                 .select_related('recipient_user', 'task_related', 'ordre_imputation_related')\
-                                 .distinct().order_by('-timestamp')
+        qs = get_notification_queryset(user)
+        if self.action == 'list' and self.request.query_params.get('unread') in ('1', 'true'):
+            qs = qs.filter(read=False)
+        return qs
 
     def perform_create(self, serializer):
         if not (self.request.user and hasattr(self.request.user, 'profile') and self.request.user.profile.role == 'Admin'):
@@ -448,16 +829,22 @@ class NotificationViewSet(viewsets.ModelViewSet):
         except Notification.DoesNotExist:
             return Response({'error': 'Notification not found or not accessible.'}, status=status.HTTP_404_NOT_FOUND)
         
-        notification.read = True
-        notification.save()
+        if not notification.read:
+            notification.read = True
+            notification.save(update_fields=['read'])
         return Response({'status': 'notification marked as read'}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'], url_path='mark-all-as-read', permission_classes=[IsAuthenticated])
     def mark_all_as_read(self, request):
-        notifications_to_update = self.get_queryset().filter(read=False)
-        count = notifications_to_update.update(read=True)
+        count = mark_notifications_read(self.get_queryset())
         return Response({'status': f'{count} notifications marked as read'}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'], url_path='unread-count', permission_classes=[IsAuthenticated])
+    def unread_count(self, request):
+        if not hasattr(request.user, 'profile'):
+            return Response({"detail": "User profile not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'unread_count': get_unread_notification_count(request.user)}, status=status.HTTP_200_OK)
+
 class AdminUserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all().select_related('profile').order_by('username')
     permission_classes = [IsAdminUser]
@@ -523,6 +910,162 @@ class PreventiveChecklistSubmissionView(views.APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def get_sync_watermark_margin():
+    return timedelta(seconds=getattr(settings, 'SYNC_WATERMARK_MARGIN_SECONDS', 120))
+
+class SyncView(views.APIView):
+    """
+    Incremental sync for tasks, advancement notes and OIs.
+
+    `GET /sync/?since=<watermark>` returns only the rows changed after the
+    watermark plus the ids deleted since then, scoped like the regular list
+    endpoints. Without `since` the full dataset is returned. Clients store
+    the returned `watermark` and send it back on the next call; it trails the
+    response by SYNC_WATERMARK_MARGIN_SECONDS, so consecutive syncs overlap
+    and rows must be applied by id. Task rows use
+    the compact list representation and honour `?fields=`/`?expand=`.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        if not hasattr(request.user, 'profile'):
+            return Response({"detail": "User profile not found."}, status=status.HTTP_404_NOT_FOUND)
+        profile = request.user.profile
+
+        since = None
+        since_str = request.query_params.get('since')
+        if since_str:
+            # An unencoded '+' in the UTC offset arrives as a space.
+            since = parse_datetime(since_str.replace(' ', '+'))
+            if since is None:
+                return Response({"error": "Invalid 'since' watermark. Use the value returned by a previous sync."}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        # Taken before querying, and pulled back by a margin: updated_at is stamped when a row is
+        # saved, so a transaction still open now can commit rows older than this instant. Clients
+        # dedupe by id, so the overlap only resends a few rows.
+        watermark = timezone.now() - get_sync_watermark_margin()
+
+        tasks = get_task_list_queryset(request)
+        notes = AdvancementNote.objects.select_related('task').prefetch_related('images')
+        ordres = OrdreImputation.objects.all()
+        tombstones = SyncTombstone.objects.all()
+
+        if profile.role == 'Chef de Parc':
+            tasks = tasks.filter(assigned_to_profile=profile)
+            notes = notes.filter(task__assigned_to_profile=profile)
+            tombstones = tombstones.filter(Q(scope_profile_id=profile.id) | Q(scope_profile_id__isnull=True))
+        elif profile.role != 'Admin':
+            return Response({"detail": "You do not have permission to sync tasks."}, status=status.HTTP_403_FORBIDDEN)
+
+        if since is not None:
+            tasks = tasks.filter(updated_at__gt=since)
+            notes = notes.filter(updated_at__gt=since)
+            ordres = ordres.filter(updated_at__gt=since)
+            tombstones = tombstones.filter(deleted_at__gt=since)
+        else:
+            tombstones = tombstones.none()
+
+        deleted = {'tasks': [], 'advancement_notes': [], 'ordres_imputation': []}
+        tombstone_keys = {'task': 'tasks', 'advancement_note': 'advancement_notes', 'ordre_imputation': 'ordres_imputation'}
+        for model_name, object_id in tombstones.values_list('model_name', 'object_id'):
+            deleted[tombstone_keys[model_name]].append(object_id)
+
+        context = {'request': request}
+        return Response({
+            'watermark': watermark.isoformat(),
+            'full': since is None,
+            'tasks': serialize_task_list(tasks.order_by('-created_at', 'id'), request),
+            'advancement_notes': AdvancementNoteSerializer(notes.order_by('created_at'), many=True, context=context).data,
+            'ordres_imputation': OrdreImputationSerializer(ordres, many=True, context=context).data,
+            'deleted': deleted,
+        })
+
+
+class BootstrapView(views.APIView):
+    """
+    Everything the task screen needs in one role-aware call: tasks, Chefs de
+    Parc (Admin only), technicians, OIs and notifications.
+
+    Every section carries a `version` stamp. Sending a section's last stamp
+    back as a query parameter (e.g. `?tasks=<version>&technicians=<version>`)
+    makes the server answer `{"version": ..., "unchanged": true}` for that
+    section instead of serializing it again. Task rows use the compact list
+    representation and honour `?fields=`/`?expand=`.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @staticmethod
+    def make_version(*parts):
+        return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+    def section(self, request, name, version, build_data):
+        if request.query_params.get(name) == version:
+            return {'version': version, 'unchanged': True}
+        return {'version': version, 'data': build_data()}
+
+    def get(self, request, *args, **kwargs):
+        if not hasattr(request.user, 'profile'):
+            return Response({"detail": "User profile not found."}, status=status.HTTP_404_NOT_FOUND)
+        profile = request.user.profile
+        if profile.role not in ('Admin', 'Chef de Parc'):
+            return Response({"detail": "You do not have permission to load this data."}, status=status.HTTP_403_FORBIDDEN)
+        context = {'request': request}
+
+        task_scope = Task.objects.all()
+        if profile.role == 'Chef de Parc':
+            task_scope = task_scope.filter(assigned_to_profile=profile)
+        task_stats = task_scope.aggregate(count=Count('id'), last_update=Max('updated_at'))
+        tasks_version = self.make_version(
+            task_stats['count'], task_stats['last_update'],
+            sorted(TaskListSerializer.requested_fields(request))
+        )
+
+        def build_tasks():
+            tasks = get_task_list_queryset(request)
+            if profile.role == 'Chef de Parc':
+                tasks = tasks.filter(assigned_to_profile=profile)
+            return serialize_task_list(tasks.order_by('-created_at', 'id'), request)
+
+        oi_version = self.make_version(get_collection_version('ordres_imputation'))
+        technicians_version = self.make_version(get_collection_version('technicians'))
+
+        notifications = get_notification_queryset(request.user)
+        notification_stats = notifications.order_by().aggregate(
+            count=Count('id'), last_id=Max('id'), unread=Count('id', filter=Q(read=False))
+        )
+        notifications_version = self.make_version(
+            notification_stats['count'], notification_stats['last_id'], notification_stats['unread']
+        )
+
+        payload = {
+            'tasks': self.section(request, 'tasks', tasks_version, build_tasks),
+            'technicians': self.section(
+                request, 'technicians', technicians_version,
+                lambda: TechnicianSerializer(Technician.objects.all(), many=True, context=context).data
+            ),
+            'ordres_imputation': self.section(
+                request, 'ordres_imputation', oi_version,
+                lambda: OrdreImputationSerializer(OrdreImputation.objects.all(), many=True, context=context).data
+            ),
+            'notifications': self.section(
+                request, 'notifications', notifications_version,
+                lambda: NotificationSerializer(notifications, many=True, context=context).data
+            ),
+        }
+
+        if profile.role == 'Admin':
+            payload['chefs'] = self.section(
+                request, 'chefs', self.make_version(get_collection_version('user_profiles')),
+                lambda: UserProfileSerializer(
+                    UserProfile.objects.filter(role='Chef de Parc').select_related('user'), many=True, context=context
+                ).data
+            )
+
+        return Response(payload)
+
+
 class AdminTaskReportView(views.APIView):
     permission_classes = [IsAdminUser]
     renderer_classes = [JSONRenderer, PassthroughPDFRenderer]
@@ -532,178 +1075,31 @@ class AdminTaskReportView(views.APIView):
         end_date_str = request.query_params.get('end_date')
         ordre_imputation_values = request.query_params.getlist('ordre_imputation_value')
 
-        queryset = Task.objects.select_related(
-            'ordre', 
-            'assigned_to_profile__user'
-        ).prefetch_related(
-            'techniciens', 
-            'advancement_notes__images', 
-            'advancement_notes__created_by'
-        ).all().order_by('ordre__value', 'created_at')
-
-        if ordre_imputation_values:
-            queryset = queryset.filter(ordre__value__in=ordre_imputation_values)
-
+        start_date = end_date = None
         if start_date_str and end_date_str:
             try:
                 start_date = timezone.datetime.strptime(start_date_str, '%Y-%m-%d').date()
                 end_date = timezone.datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                queryset = queryset.filter(
-                    (Q(start_date__lte=end_date) | Q(start_date__isnull=True)) &
-                    (Q(end_date__gte=start_date) | Q(end_date__isnull=True))
-                )
             except ValueError:
                 raise drf_exceptions.ValidationError({"error": "Invalid date format. Please use colorChoice-MM-DD."})
         elif start_date_str or end_date_str:
              raise drf_exceptions.ValidationError({"error": "Both start date and end date are required for date range filtering, or neither for no date filter."})
         
-        return queryset
+        return task_report_queryset(ordre_imputation_values, start_date, end_date)
 
     def generate_pdf_report(self, queryset, request, start_date_str=None, end_date_str=None, ordre_imputation_value=None):
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), rightMargin=inch/2, leftMargin=inch/2, topMargin=inch/2, bottomMargin=inch/2)
-        styles = getSampleStyleSheet()
-        story = []
-
-        title_text = "Rapport d'Activités des Tâches"
-        filter_criteria = []
-        if ordre_imputation_value and len(ordre_imputation_value) > 0:
-            filter_criteria.append(f"Ordre(s) d'Imputation: {', '.join(ordre_imputation_value)}")
-        if start_date_str and end_date_str:
-            filter_criteria.append(f"Période: {start_date_str} au {end_date_str}")
-        
-        if filter_criteria:
-            title_text += " (" + ", ".join(filter_criteria) + ")"
-            
-        story.append(Paragraph(title_text, styles['h2']))
-        story.append(Paragraph(f"Généré le: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')} par {request.user.username}", styles['Normal']))
-        story.append(Spacer(1, 0.15*inch))
-
-        if not queryset.exists():
-            story.append(Paragraph("Aucune tâche trouvée pour les critères sélectionnés.", styles['Normal']))
-            doc.build(story)
-            buffer.seek(0)
-            return buffer
-
-        small_text_style = ParagraphStyle('small_text', parent=styles['Normal'], fontSize=7, leading=9)
-        header_style = ParagraphStyle('header_text', parent=styles['Normal'], fontSize=7, leading=9, fontName='Helvetica-Bold', alignment=1)
-        
-        task_table_data = []
-        
-        task_headers = [
-            Paragraph("ID Tâche", header_style), Paragraph("O.I.", header_style), Paragraph("Type", header_style), 
-            Paragraph("Description Tâche", header_style), Paragraph("Statut", header_style), 
-            Paragraph("Chef Parc", header_style), Paragraph("Techniciens", header_style), 
-            Paragraph("H Travail", header_style), Paragraph("Début", header_style), Paragraph("Fin", header_style)
-        ]
-        task_table_data.append(task_headers)
-        
-        col_widths = [0.7*inch, 1.0*inch, 0.7*inch, 1.8*inch, 0.6*inch, 0.9*inch, 1.0*inch, 0.5*inch, 0.6*inch, 0.6*inch]
-
-        for task in queryset:
-            techniciens_str = ", ".join([t.name for t in task.techniciens.all()])
-            task_data_row = [
-                Paragraph(task.task_id_display or str(task.id), small_text_style),
-                Paragraph(task.ordre.value if task.ordre else "N/A", small_text_style),
-                Paragraph(task.get_type_display(), small_text_style),
-                Paragraph(task.tasks, small_text_style),
-                Paragraph(task.get_status_display(), small_text_style),
-                Paragraph(task.assigned_to_profile.name if task.assigned_to_profile else "N/A", small_text_style),
-                Paragraph(techniciens_str if techniciens_str else "N/A", small_text_style),
-                Paragraph(str(task.hours_of_work) if task.hours_of_work is not None else "N/A", small_text_style),
-                Paragraph(task.start_date.strftime('%d-%m-%Y') if task.start_date else "N/A", small_text_style),
-                Paragraph(task.end_date.strftime('%d-%m-%Y') if task.end_date else "N/A", small_text_style),
-            ]
-            task_table_data.append(task_data_row)
-
-            if task.advancement_notes.exists():
-                task_table_data.append([Paragraph(f"<b>Notes pour Tâche {task.task_id_display or task.id}:</b>", small_text_style)] + [''] * (len(col_widths) - 1))
-                
-                notes_header_row_text = ["Date", "Auteur", "Note", "Images"]
-                task_table_data.append([
-                    Paragraph(f"<b>{notes_header_row_text[0]}</b>", small_text_style),
-                    Paragraph(f"<b>{notes_header_row_text[1]}</b>", small_text_style),
-                    Paragraph(f"<b>{notes_header_row_text[2]}</b>", small_text_style),
-                    '', '', '',
-                    Paragraph(f"<b>{notes_header_row_text[3]}</b>", small_text_style),
-                    '', '', ''
-                ])
-
-                for note in task.advancement_notes.all().order_by('date'):
-                    image_flowables = []
-                    for img_obj in note.images.all():
-                        if img_obj.image and hasattr(img_obj.image, 'path'):
-                            try:
-                                if os.path.exists(img_obj.image.path):
-                                    img = Image(img_obj.image.path, width=0.4*inch, height=0.4*inch) 
-                                    img.hAlign = 'LEFT'
-                                    image_flowables.append(img)
-                                else:
-                                    image_flowables.append(Paragraph("[img absente]", small_text_style))
-                            except Exception:
-                                image_flowables.append(Paragraph("[err img]", small_text_style))
-                        else:
-                             image_flowables.append(Paragraph("[ref img invalide]", small_text_style))
-                    
-                    image_content = image_flowables if image_flowables else Paragraph("Aucune", small_text_style)
-
-                    note_detail_row = [
-                        Paragraph(note.date.strftime('%d-%m-%Y'), small_text_style),
-                        Paragraph(note.created_by_username or (note.created_by.username if note.created_by else "Système"), small_text_style),
-                        Paragraph(note.note, small_text_style),
-                        '', '', '',
-                        image_content,
-                        '', '', ''
-                    ]
-                    task_table_data.append(note_detail_row)
-                task_table_data.append([''] * len(col_widths))
-
-        table = Table(task_table_data, colWidths=col_widths, repeatRows=1)
-        
-        style_commands = [
-            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.black),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('ALIGN', (0,0), (-1,0), 'CENTER'),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0,0), (-1,0), 6),
-            ('GRID', (0,0), (-1,-1), 0.5, colors.black),
-            ('VALIGN', (0,0), (-1,-1), 'TOP'),
-        ]
-
-        for i, row_content in enumerate(task_table_data):
-            if not row_content or not isinstance(row_content[0], Paragraph): continue
-
-            first_cell_text = row_content[0].text
-            
-            if "<b>Notes pour Tâche" in first_cell_text:
-                style_commands.append(('SPAN', (0, i), (-1, i)))
-                style_commands.append(('BACKGROUND', (0, i), (-1, i), colors.lightblue))
-                style_commands.append(('TEXTCOLOR', (0,i), (-1,i), colors.black))
-                
-                if i + 1 < len(task_table_data):
-                    style_commands.append(('SPAN', (2, i + 1), (5, i + 1))) 
-                    style_commands.append(('SPAN', (6, i + 1), (9, i + 1))) 
-                    style_commands.append(('BACKGROUND', (0, i + 1), (-1, i + 1), colors.lightcyan))
-                    style_commands.append(('ALIGN', (0, i + 1), (-1, i + 1), 'CENTER'))
-                    style_commands.append(('FONTNAME', (0, i + 1), (-1, i + 1), 'Helvetica-Bold'))
-
-            if i > 1:
-                row_before_previous = task_table_data[i-2]
-                if isinstance(row_before_previous[0], Paragraph) and "<b>Notes pour Tâche" in row_before_previous[0].text:
-                    previous_row = task_table_data[i-1]
-                    if isinstance(previous_row[0], Paragraph) and "<b>Date</b>" in previous_row[0].text: 
-                        style_commands.append(('SPAN', (2, i), (5, i)))
-                        style_commands.append(('SPAN', (6, i), (9, i)))
-                        style_commands.append(('BACKGROUND', (0, i), (-1, i), colors.whitesmoke))
-                        style_commands.append(('VALIGN', (6, i), (6,i), 'MIDDLE'))
-
-        table.setStyle(TableStyle(style_commands))
-        story.append(table)
-        
-        doc.build(story)
-        buffer.seek(0)
-        return buffer
+        """
+        Renders the report into an anonymous temporary file, one table per O.I.
+        and per PDF_REPORT_ROWS_PER_TABLE rows, and returns it rewound.
+        """
+        spool = tempfile.TemporaryFile()
+        try:
+            build_task_report_pdf(queryset, spool, request.user.username, start_date_str, end_date_str, ordre_imputation_value)
+        except Exception:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
 
     def get(self, request, *args, **kwargs):
         output_format = request.query_params.get('format', 'json') 
@@ -733,10 +1129,14 @@ class AdminTaskReportView(views.APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                pdf_buffer = self.generate_pdf_report(queryset, request, start_date_str, end_date_str, ordre_imputation_values)
-                response = HttpResponse(pdf_buffer, content_type='application/pdf')
-                response['Content-Disposition'] = f'attachment; filename="rapport_taches_{timezone.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-                return response
+                pdf_file = self.generate_pdf_report(queryset, request, start_date_str, end_date_str, ordre_imputation_values)
+                # FileResponse streams the spooled file in blocks and closes it once sent.
+                return FileResponse(
+                    pdf_file,
+                    as_attachment=True,
+                    filename=f"rapport_taches_{timezone.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                    content_type='application/pdf'
+                )
             except Exception as e:
                 traceback.print_exc()
                 return Response(
@@ -752,4 +1152,41 @@ class AdminTaskReportView(views.APIView):
                 return Response(
                     {"error": "An unexpected error occurred during JSON serialization.", "detail": str(e)},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
\ No newline at end of file
+                )
+
+
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Background version of /admin/task-reports/: POST the filters to get a job,
+    poll it until `status` is 'done', then GET its `download_url`.
+    Identical requests over unchanged tasks reuse the finished job.
+    """
+    queryset = ReportJob.objects.select_related('requested_by').order_by('-created_at')
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAdminUser]
+
+    def create(self, request, *args, **kwargs):
+        request_serializer = ReportJobCreateSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        data = request_serializer.validated_data
+        filters = normalize_report_filters(data.get('ordre_imputation_value'), data.get('start_date'), data.get('end_date'))
+        job, reused = submit_report_job(request.user, data['output_format'], filters)
+        response_serializer = self.get_serializer(job)
+        if reused and job.status == 'done':
+            return Response(response_serializer.data, status=status.HTTP_200_OK)
+        return Response(response_serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughPDFRenderer])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != 'done' or not job.result:
+            return Response(
+                {"detail": "Le rapport n'est pas encore prêt.", "status": job.status},
+                status=status.HTTP_409_CONFLICT
+            )
+        return FileResponse(
+            job.result.open('rb'),
+            as_attachment=True,
+            filename=f"rapport_taches_{job.created_at.strftime('%Y%m%d_%H%M%S')}.{job.output_format}",
+            content_type='application/pdf' if job.output_format == 'pdf' else 'application/json'
+        )
@@ -0,0 +1,49 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.db import connections
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _call_in_worker(func, args):
+    try:
+        return func(*args)
+    finally:
+        connections.close_all()
+
+
+def get_process_pool(name, max_workers, reset=False):
+    """
+    The named process-wide pool for heavy background work (reports, image
+    processing). Workers are spawned, not forked, so they never share the
+    parent's database connections, and set Django up once.
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if reset and pool is not None:
+            pool.shutdown(wait=False)
+            pool = None
+        if pool is None:
+            pool = _pools[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return pool
+
+
+def submit_to_pool(name, max_workers, func, *args):
+    """Runs the module-level `func(*args)` in the named pool; a pool broken by a crashed worker is replaced once."""
+    try:
+        return get_process_pool(name, max_workers).submit(_call_in_worker, func, args)
+    except BrokenProcessPool:
+        return get_process_pool(name, max_workers, reset=True).submit(_call_in_worker, func, args)
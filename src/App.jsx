@@ -1,7 +1,7 @@
 // src/App.jsx
-import React, { useState, useMemo, useEffect, useCallback } from 'react';
+import React, { useState, useMemo, useEffect, useCallback, useRef } from 'react';
 import { Plus, Bell, LogOut, Briefcase, Wrench, CheckCircle, Clock, UsersRound, Archive, FileText, ClipboardList, Hourglass, Camera } from 'lucide-react';
-import { apiRequest, getAuthToken } from './api/api';
+import { apiRequest, getAuthToken, syncMediaSession } from './api/api';
 import LoginView from './components/auth/LoginView';
 import TaskCard from './components/tasks/TaskCard';
 import NotificationDropdown from './components/common/NotificationDropdown';
@@ -58,6 +58,7 @@ function App() {
   const [isOiFormModalOpen, setIsOiFormModalOpen] = useState(false);
   const [editingOi, setEditingOi] = useState(null);
   const [isLoadingTechnicians, setIsLoadingTechnicians] = useState(false);
+  const bootstrapVersionsRef = useRef({});
   const [isTechnicianFormModalOpen, setIsTechnicianFormModalOpen] = useState(false);
   const [editingTechnician, setEditingTechnician] = useState(null);
   const [isPreventiveTaskManagementOpen, setIsPreventiveTaskManagementOpen] = useState(false);
@@ -95,6 +96,7 @@ function App() {
   };
 
   const handleLogout = () => {
+    syncMediaSession('DELETE').catch(() => {});
     localStorage.removeItem('authToken');
     localStorage.removeItem('currentUser');
     localStorage.removeItem('taskFilter');
@@ -170,31 +172,36 @@ function App() {
       return;
     }
     setLoginError('');
-    const apiPromises = [
-      apiRequest('/tasks/'),
-      apiRequest('/technicians/'),
-      apiRequest('/ordres-imputation/'),
-      apiRequest('/notifications/')
-    ];
-    if (currentUser.role === 'Admin') {
-      apiPromises.splice(1, 0, apiRequest('/userprofiles/by-role/Chef%20de%20Parc/'));
-    } else {
-      apiPromises.splice(1, 0, Promise.resolve([]));
-    }
+    // Sections whose version is unchanged come back without data, so the current state is kept.
+    const params = new URLSearchParams({ expand: 'ordre,technicien_names', ...bootstrapVersionsRef.current });
     try {
-      const [tasksData, chefsDataResult, techsData, ordresData, notifsData] = await Promise.all(apiPromises);
-      const processedTasks = (tasksData || []).map(task => ({
-        ...task,
-        task_id_display: task.task_id_display || `ORDT-${task.id}`,
-        ordre: task.ordre ? { ...task.ordre, date_prochain_cycle_visite: task.ordre.date_prochain_cycle_visite || null, date_derniere_visite_effectuee: task.ordre.date_derniere_visite_effectuee || null, dernier_cycle_visite_resultat: task.ordre.dernier_cycle_visite_resultat === undefined ? null : task.ordre.dernier_cycle_visite_resultat, } : null,
-        advancement_notes: (task.advancement_notes || []).map(note => ({ ...note, task_display_id: note.task_display_id || task.task_id_display || `ORDT-${task.id}`, images: note.images || [] }))
-      }));
-      setTasks(processedTasks);
-      setChefsDeParc(chefsDataResult || []);
-      setTechnicians(techsData || []);
-      setOrdresImputation(ordresData || []);
-      setNotifications(notifsData || []);
+      const bootstrapData = await apiRequest(`/bootstrap/?${params.toString()}`);
+      const sectionData = (name) => {
+        const section = bootstrapData[name];
+        if (!section) return undefined;
+        bootstrapVersionsRef.current[name] = section.version;
+        return section.unchanged ? undefined : (section.data || []);
+      };
+      const tasksData = sectionData('tasks');
+      if (tasksData !== undefined) {
+        const processedTasks = tasksData.map(task => ({
+          ...task,
+          task_id_display: task.task_id_display || `ORDT-${task.id}`,
+          ordre: task.ordre ? { ...task.ordre, date_prochain_cycle_visite: task.ordre.date_prochain_cycle_visite || null, date_derniere_visite_effectuee: task.ordre.date_derniere_visite_effectuee || null, dernier_cycle_visite_resultat: task.ordre.dernier_cycle_visite_resultat === undefined ? null : task.ordre.dernier_cycle_visite_resultat, } : null,
+          advancement_notes: (task.advancement_notes || []).map(note => ({ ...note, task_display_id: note.task_display_id || task.task_id_display || `ORDT-${task.id}`, images: note.images || [] }))
+        }));
+        setTasks(processedTasks);
+      }
+      const chefsData = currentUser.role === 'Admin' ? sectionData('chefs') : [];
+      if (chefsData !== undefined) setChefsDeParc(chefsData);
+      const techsData = sectionData('technicians');
+      if (techsData !== undefined) setTechnicians(techsData);
+      const ordresData = sectionData('ordres_imputation');
+      if (ordresData !== undefined) setOrdresImputation(ordresData);
+      const notifsData = sectionData('notifications');
+      if (notifsData !== undefined) setNotifications(notifsData);
     } catch (error) {
+      bootstrapVersionsRef.current = {};
       console.error("echec de la recuperation des donnees initiales (tasks):", error);
       const errorMessage = error.message || "Une erreur inconnue s'est produite.";
       if (error.message && error.message.includes("permission")) {
@@ -276,6 +283,17 @@ function App() {
     }
   }, []);
 
+  useEffect(() => {
+    if (!currentUser) return undefined;
+    // Note images are loaded with a cookie that expires; renew it halfway through its lifetime.
+    let renewTimer = null;
+    const renewMediaSession = () => syncMediaSession()
+      .then(expiresIn => { renewTimer = setTimeout(renewMediaSession, Math.max(60, expiresIn / 2) * 1000); })
+      .catch(err => { console.error("Erreur lors de l'ouverture de la session des images:", err); });
+    renewMediaSession();
+    return () => clearTimeout(renewTimer);
+  }, [currentUser]);
+
   useEffect(() => {
     const token = getAuthToken();
     if (currentUser && token) {
@@ -307,6 +325,7 @@ function App() {
             .finally(() => { setIsLoadingData(false); });
     } else {
         setIsLoadingData(false);
+        bootstrapVersionsRef.current = {};
         setTasks([]);
         setNotifications([]);
         setChefsDeParc([]);
@@ -9,6 +9,26 @@ export const DJANGO_DOMAIN_URL = 'http://127.0.0.1:8000';
  */
 export const getAuthToken = () => localStorage.getItem('authToken');
 
+/**
+ * Sets or renews the cookie that lets <img> tags load note images from the
+ * authenticated media endpoint (they cannot send the Authorization header).
+ * Sent with credentials so the browser keeps the cookie when the API is on another origin.
+ * @param {string} [method='POST'] - 'POST' to set or renew the cookie, 'DELETE' to clear it.
+ * @returns {Promise<number|null>} Seconds until the cookie expires, or null after a DELETE.
+ */
+export const syncMediaSession = async (method = 'POST') => {
+  const token = getAuthToken();
+  const response = await fetch(`${API_BASE_URL}/media-session/`, {
+    method,
+    credentials: 'include',
+    headers: token ? { Authorization: `Token ${token}` } : {},
+  });
+  if (!response.ok) {
+    throw new Error(`La session des images a echoue avec le statut ${response.status}`);
+  }
+  return response.status === 204 ? null : (await response.json()).expires_in;
+};
+
 /**
  * A helper function for making API requests to the Django backend.
  * @param {string} endpoint - The API endpoint to hit (e.g., '/tasks/').
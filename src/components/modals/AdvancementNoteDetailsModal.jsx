@@ -41,7 +41,7 @@ const AdvancementNoteDetailsModal = ({ note, isOpen, onClose, onOpenLightbox })
                         <div className="grid grid-cols-2 sm:grid-cols-3 gap-3">
                             {noteImages.map((imageObj) => {
                                 const rawImageUrlFromApi = imageObj.image_url;
-                                const thumbnailUrl = getDisplayImageUrl(rawImageUrlFromApi);
+                                const thumbnailUrl = getDisplayImageUrl(imageObj.thumbnail_url || rawImageUrlFromApi);
                                 const downloadUrl = getDisplayImageUrl(rawImageUrlFromApi);
                                 const imageName = rawImageUrlFromApi ? rawImageUrlFromApi.split('/').pop() : `image_${imageObj.id}`;
                                 const imageId = `note-image-${note.id}-${imageObj.id}`;
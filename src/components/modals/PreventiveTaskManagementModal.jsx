@@ -58,7 +58,7 @@ const PreventiveTaskManagementModal = ({
         setError('');
         
         try {
-            const response = await apiRequest('/tasks/');
+            const response = await apiRequest('/tasks/?expand=ordre,technicien_names');
             // Filter for preventive tasks only
             const preventiveTasks = response.filter(task => task.type === 'preventif');
             setTasks(preventiveTasks);
@@ -394,9 +394,9 @@ const PreventiveTaskManagementModal = ({
                                                     {task.tasks}
                                                 </p>
                                                 
-                                                {task.advancement_notes && task.advancement_notes.length > 0 && (
+                                                {task.note_count > 0 && (
                                                     <div className="text-xs text-blue-600">
-                                                        {task.advancement_notes.reduce((total, note) => total + (note.images?.length || 0), 0)} image(s) attachée(s)
+                                                        {task.image_count || 0} image(s) attachée(s)
                                                     </div>
                                                 )}
                                             </div>